@@ -1,14 +1,36 @@
 import os
 import subprocess
+import wave
+
+SAMPLE_RATE = 16000
+# Suffix of the extracted WAV when the input is itself a WAV, so ffmpeg never writes onto its input
+EXTRACTED_AUDIO_SUFFIX = "_audio"
+
+
+def extracted_audio_path(video_path: str) -> str:
+    """Where the 16 kHz mono WAV for a recording goes: data/interview.wav for data/interview.mp4."""
+    base_name, extension = os.path.splitext(video_path)
+    if extension.lower() == ".wav":
+        return f"{base_name}{EXTRACTED_AUDIO_SUFFIX}.wav"
+    return f"{base_name}.wav"
 
 
 class AudioExtractionAgent:
-    def __init__(self, state_manager):
+    def __init__(self, state_manager, in_memory: bool = False, save_wav: bool = True):
         self.state_manager = state_manager
+        # in_memory: decode straight into a float32 array for Whisper instead of via a WAV file
+        self.in_memory = in_memory
+        # save_wav: in in-memory mode, still write the WAV next to the video for users who want it
+        self.save_wav = save_wav
 
     def run(self, video_path: str):
         # Logic to extract audio from video
-        audio_path = self.extract_audio(video_path)
+        if self.in_memory:
+            audio_path, audio_array = self.extract_audio_array(video_path, save_wav=self.save_wav)
+            self.state_manager.set_state("audio_array", audio_array)
+        else:
+            audio_path = self.extract_audio(video_path)
+            self.state_manager.set_state("audio_array", None)
         self.state_manager.set_state("audio_path", audio_path)
         return audio_path
 
@@ -20,8 +42,7 @@ class AudioExtractionAgent:
                 raise FileNotFoundError(f"Video file not found: {video_path}")
 
             # Generate output audio path
-            base_name = os.path.splitext(video_path)[0]
-            extracted_audio_path = f"{base_name}.wav"
+            output_path = extracted_audio_path(video_path)
 
             print(f"Extracting audio from {video_path}...")
 
@@ -34,11 +55,11 @@ class AudioExtractionAgent:
                 "-acodec",
                 "pcm_s16le",  # Audio codec
                 "-ar",
-                "16000",  # Sample rate (16kHz is good for speech)
+                str(SAMPLE_RATE),  # Sample rate (16kHz is good for speech)
                 "-ac",
                 "1",  # Mono audio
                 "-y",  # Overwrite output file if it exists
-                extracted_audio_path,
+                output_path,
             ]
 
             # Run ffmpeg command
@@ -48,12 +69,80 @@ class AudioExtractionAgent:
                 raise RuntimeError(f"FFmpeg failed with error: {result.stderr}")
 
             # Check if output file was created
-            if not os.path.exists(extracted_audio_path):
+            if not os.path.exists(output_path):
                 raise RuntimeError("Audio extraction failed - output file not created")
 
-            print(f"Audio successfully extracted to {extracted_audio_path}")
-            return extracted_audio_path
+            print(f"Audio successfully extracted to {output_path}")
+            return output_path
 
         except Exception as e:
             print(f"Error extracting audio: {str(e)}")
             raise e
+
+    def extract_audio_array(self, video_path: str, save_wav: bool = True):
+        """
+        Decode audio with ffmpeg straight into memory as 16 kHz mono float32 samples.
+
+        ffmpeg writes raw PCM to a pipe, so there is no intermediate WAV to write and
+        no second decode inside Whisper.
+
+        Returns:
+            Tuple of (WAV path, float32 NumPy array). The path is where the WAV was
+            written when save_wav is True, otherwise where it would have been.
+        """
+        try:
+            if not os.path.exists(video_path):
+                raise FileNotFoundError(f"Video file not found: {video_path}")
+
+            audio_path = extracted_audio_path(video_path)
+
+            print(f"Decoding audio from {video_path} into memory...")
+
+            command = [
+                "ffmpeg",
+                "-nostdin",
+                "-i",
+                video_path,
+                "-vn",  # No video
+                "-f",
+                "s16le",  # Raw PCM on stdout
+                "-acodec",
+                "pcm_s16le",
+                "-ar",
+                str(SAMPLE_RATE),
+                "-ac",
+                "1",
+                "-",
+            ]
+
+            result = subprocess.run(command, capture_output=True)
+
+            if result.returncode != 0:
+                raise RuntimeError(
+                    f"FFmpeg failed with error: {result.stderr.decode('utf-8', errors='replace')}"
+                )
+
+            import numpy as np
+
+            # View the pipe buffer as int16 without copying, then scale once to float32
+            pcm = np.frombuffer(result.stdout, dtype=np.int16)
+            audio_array = pcm.astype(np.float32) / 32768.0
+
+            if save_wav:
+                self.write_wav(result.stdout, audio_path)
+                print(f"Audio also saved to {audio_path}")
+
+            print(f"Decoded {len(audio_array) / SAMPLE_RATE:.1f}s of audio into memory")
+            return audio_path, audio_array
+
+        except Exception as e:
+            print(f"Error extracting audio: {str(e)}")
+            raise e
+
+    def write_wav(self, pcm_bytes: bytes, output_path: str):
+        """Write raw 16-bit mono PCM to a WAV file without re-running ffmpeg."""
+        with wave.open(output_path, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(SAMPLE_RATE)
+            f.writeframes(pcm_bytes)
@@ -0,0 +1,220 @@
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from agents.audio_extraction_agent import extracted_audio_path
+from agents.orchestrator_agent import OrchestratorAgent
+from core.state_mangement import StateManager
+from utils.media import MEDIA_EXTENSIONS
+
+
+def discover_inputs(path: str) -> List[str]:
+    """
+    Resolve a batch input to a list of media files
+
+    Args:
+        path: A directory (scanned for media files, leaving out the WAVs this
+            pipeline extracted from other files there) or a manifest file, either a
+            JSON list of paths or a text file with one path per line. Relative
+            manifest entries are resolved against the manifest's directory.
+
+    Returns:
+        Sorted list of media file paths
+    """
+    if os.path.isdir(path):
+        names = [name for name in os.listdir(path) if name.lower().endswith(MEDIA_EXTENSIONS)]
+        # interview.wav next to interview.mp4 is that video's extracted audio, not another recording
+        extracted = {extracted_audio_path(name) for name in names}
+        return sorted(os.path.join(path, name) for name in names if name not in extracted)
+
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            entries = json.load(f)
+        else:
+            entries = [
+                line.strip()
+                for line in f
+                if line.strip() and not line.strip().startswith("#")
+            ]
+
+    base_dir = os.path.dirname(path)
+    return [entry if os.path.isabs(entry) else os.path.join(base_dir, entry) for entry in entries]
+
+
+class BatchOrchestratorAgent:
+    """
+    Run the pipeline over many recordings with the stages overlapped
+
+    Extraction (ffmpeg), transcription (Whisper) and the LLM stages each have
+    their own worker pool, so while file N is in the LLM stages, file N+1 can be
+    transcribed and file N+2 extracted. With overlap_llm, transcription and the
+    LLM stages of a file run as one stage on the transcription pool, since its
+    LLM calls are sent while Whisper decodes.
+    """
+
+    def __init__(
+        self,
+        extraction_workers: int = 2,
+        transcription_workers: int = 1,
+        llm_workers: int = 2,
+        max_in_flight: int = None,
+        state_path: str = None,
+        **orchestrator_kwargs,
+    ):
+        self.extraction_workers = extraction_workers
+        self.transcription_workers = transcription_workers
+        self.llm_workers = llm_workers
+        # Bounds how far extraction can run ahead of the LLM stages (disk and memory)
+        self.max_in_flight = max_in_flight or (
+            extraction_workers + transcription_workers + llm_workers
+        )
+        # Optional SQLite file shared by every file's state, so an interrupted batch can resume
+        self.state_path = state_path
+        self.orchestrator_kwargs = orchestrator_kwargs
+
+    def run(self, inputs) -> List[Dict[str, Any]]:
+        """
+        Process every input file and return one result entry per file, in input order
+
+        Args:
+            inputs: A directory or manifest path, or a list of media file paths
+        """
+        video_paths = discover_inputs(inputs) if isinstance(inputs, str) else list(inputs)
+        print(f"\n📦 Starting batch pipeline for {len(video_paths)} files...\n")
+
+        slots = threading.Semaphore(self.max_in_flight)
+        results = []
+        done_futures = []
+
+        with ThreadPoolExecutor(self.extraction_workers, thread_name_prefix="extract") as extraction_pool, \
+                ThreadPoolExecutor(self.transcription_workers, thread_name_prefix="transcribe") as transcription_pool, \
+                ThreadPoolExecutor(self.llm_workers, thread_name_prefix="llm") as llm_pool:
+            pools = [extraction_pool, transcription_pool, llm_pool]
+
+            for video_path in video_paths:
+                slots.acquire()
+                job = self._make_job(video_path)
+                results.append(job["result"])
+                done = self._submit(job, pools)
+                done.add_done_callback(lambda _: slots.release())
+                done_futures.append(done)
+
+            for done in done_futures:
+                done.result()
+
+        self._print_summary(results)
+        return results
+
+    def _make_job(self, video_path: str) -> Dict[str, Any]:
+        # Each file gets its own state and agents; the Ollama client and Whisper models are shared
+        state = StateManager(self.state_path, run_id=os.path.abspath(video_path))
+        return {
+            "video_path": video_path,
+            "state": state,
+            "orchestrator": OrchestratorAgent(state, **self.orchestrator_kwargs),
+            "result": {
+                "video_path": video_path,
+                "status": "pending",
+                "failed_stage": None,
+                "error": None,
+                "stage_seconds": {},
+            },
+        }
+
+    def _submit(self, job: Dict[str, Any], pools) -> Future:
+        """Chain the three stages of one file across the pools and return a Future for its completion."""
+        orchestrator = job["orchestrator"]
+        video_path = job["video_path"]
+        result = job["result"]
+        done = Future()
+        stages = [
+            ("keys", lambda _: orchestrator.stage_keys(video_path)),
+            ("extraction", lambda keys: (keys, orchestrator.extraction_stage(video_path, keys))),
+        ]
+        # Hashing the video for the cache keys is disk work, like extraction
+        stage_pools = [pools[0], pools[0]]
+        if orchestrator.overlap_llm:
+            stages.append(
+                ("overlapped_analysis", lambda prev: orchestrator.overlapped_analysis_stage(video_path, prev[0], prev[1]))
+            )
+            stage_pools.append(pools[1])
+        else:
+            stages += [
+                ("transcription", lambda prev: (prev[0], orchestrator.transcription_stage(video_path, prev[0], prev[1]))),
+                ("analysis", lambda prev: orchestrator.analysis_stage(video_path, prev[0], prev[1])),
+            ]
+            stage_pools += [pools[1], pools[2]]
+
+        def timed(name, fn, value):
+            started = time.perf_counter()
+            try:
+                return fn(value)
+            finally:
+                result["stage_seconds"][name] = round(time.perf_counter() - started, 3)
+
+        def run_from(index, value):
+            name, fn = stages[index]
+            future = stage_pools[index].submit(timed, name, fn, value)
+            future.add_done_callback(lambda f: on_stage_done(index, f))
+
+        def on_stage_done(index, future):
+            name = stages[index][0]
+            error = future.exception()
+            if error is not None:
+                result.update(
+                    status="failed",
+                    failed_stage=name,
+                    error="".join(traceback.format_exception_only(type(error), error)).strip(),
+                )
+                print(f"❌ {video_path} failed during {name}: {error}")
+                done.set_result(result)
+            elif index + 1 < len(stages):
+                run_from(index + 1, future.result())
+            else:
+                self._record_success(job)
+                done.set_result(result)
+
+        run_from(0, None)
+        return done
+
+    def _record_success(self, job: Dict[str, Any]):
+        state = job["state"]
+        job["orchestrator"].save_metrics(job["video_path"])
+        job["result"].update(
+            status="ok",
+            audio_path=state.get_state("audio_path"),
+            transcript_file=state.get_state("transcript_file"),
+            segments_json_file=state.get_state("segments_json_file"),
+            segments_jsonl_file=state.get_state("segments_jsonl_file"),
+            sentiment_md_file=state.get_state("sentiment_md_file"),
+            summary_json_file=state.get_state("summary_json_file"),
+            summary_text_file=state.get_state("summary_text_file"),
+            metrics_file=state.get_state("metrics_file"),
+            language=state.get_state("language"),
+            total_segments=state.get_state("total_segments"),
+        )
+        print(f"✅ {job['video_path']} completed")
+
+    def _print_summary(self, results: List[Dict[str, Any]]):
+        succeeded = sum(1 for r in results if r["status"] == "ok")
+        print("\n📦 BATCH SUMMARY:")
+        print("=" * 50)
+        for r in results:
+            if r["status"] == "ok":
+                total = sum(r["stage_seconds"].values())
+                print(f"✅ {r['video_path']}: {r['total_segments']} segments, {total:.1f}s of stage time")
+            else:
+                print(f"❌ {r['video_path']}: failed in {r['failed_stage']} ({r['error']})")
+        print("=" * 50)
+        print(f"{succeeded}/{len(results)} files processed successfully")
+
+    def save_summary(self, results: List[Dict[str, Any]], output_path: str = "batch_summary.json") -> str:
+        """Save the per-file results and statuses as JSON."""
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4, ensure_ascii=False)
+        print(f"Batch summary saved to: {output_path}")
+        return output_path
@@ -1,63 +1,27 @@
-from langchain.schema import BaseOutputParser
-from langchain.prompts import PromptTemplate
-from utils.ollama import query_ollama
+from utils.metrics import get_metrics
+from utils.ollama import query_ollama, forget_response, get_ollama_client, StopOnJsonClosed
+from utils.token_utils import estimate_tokens
+from utils.dependency_record import segment_hash
 import json
+import os
 import re
-from typing import Dict, List, Any
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional
 
 
-class SpeakerDiarizationParser(BaseOutputParser):
-    """Parser for speaker diarization LLM output"""
-
-    def parse(self, text: str) -> Dict[str, Any]:
-        """Parse LLM response into structured speaker data"""
-        try:
-            # Try to extract JSON from the response
-            json_match = re.search(r"\{.*\}", text, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
-            else:
-                # Fallback parsing if no JSON found
-                return {"error": "Could not parse LLM response", "raw_response": text}
-        except json.JSONDecodeError:
-            return {"error": "Invalid JSON in LLM response", "raw_response": text}
+DIARIZATION_MODEL = "llama3.2"
 
-
-class DiarizationAgent:
-    def __init__(self, state_manager):
-        self.state_manager = state_manager
-        self.parser = SpeakerDiarizationParser()
-
-
-    def analyze_speakers(self, segments: List[Dict], chunk_size: int = 8) -> List[Dict]:
-        """Analyze transcript segments to identify speakers with confidence scores, in chunks."""
-
-        all_parsed_results = {"speaker_analysis": [], "summary": {}}
-        enriched_segments = []
-        total_segments = len(segments)
-        num_chunks = (total_segments + chunk_size - 1) // chunk_size
-
-        for chunk_idx in range(num_chunks):
-            chunk_start = chunk_idx * chunk_size
-            chunk_end = min((chunk_idx + 1) * chunk_size, total_segments)
-            chunk = segments[chunk_start:chunk_end]
-
-            transcript_text = " ".join([seg["text"] for seg in chunk])
-
-            # Prepare prompt for speaker diarization
-            prompt_template = PromptTemplate(
-                input_variables=["transcript", "segments"],
-                template="""
+# Each segment's text appears only once, in {segments}; literal braces are doubled
+DIARIZATION_TEMPLATE = """
 You are an expert in analyzing interview conversations and identifying speakers.
-Analyze the following interview transcript and identify who is speaking in each segment.
+Analyze the following interview segments and identify who is speaking in each one.
 
 CONTEXT: This is a job interview with typically 2 speakers:
 - INTERVIEWER: The person asking questions (usually introduces themselves, asks about experience, qualifications, etc.)
 - CANDIDATE: The person being interviewed (responds to questions, talks about their background, asks about the job)
 
-TRANSCRIPT:
-{transcript}
-
 SEGMENTS TO ANALYZE:
 {segments}
 
@@ -86,58 +50,434 @@ Return ONLY a JSON object in this exact format:
     ],
     "summary": {{}}
 }}
-""",
-            )
+"""
+# Estimated prompt tokens of the template itself
+DIARIZATION_PROMPT_TOKENS = estimate_tokens(DIARIZATION_TEMPLATE)
+# Estimated tokens per segment: the "Segment i: [start-end]" prefix and its JSON result entry
+SEGMENT_PREFIX_TOKENS = 12
+SEGMENT_RESULT_TOKENS = 40
+# Both diarization prompts ask for a single JSON object; nothing after it is parsed
+JSON_STOP = StopOnJsonClosed()
+
+_diarization_prompt = None
+
+
+def get_diarization_prompt():
+    """The diarization PromptTemplate, compiled once on first use so importing this module does not load langchain."""
+    global _diarization_prompt
+    if _diarization_prompt is None:
+        from langchain.prompts import PromptTemplate
+
+        _diarization_prompt = PromptTemplate(input_variables=["segments"], template=DIARIZATION_TEMPLATE)
+    return _diarization_prompt
+
+
+def segment_prompt_tokens(segment: Dict) -> int:
+    """Estimated tokens a segment adds to a diarization request, input and output."""
+    return estimate_tokens(segment["text"]) + SEGMENT_PREFIX_TOKENS + SEGMENT_RESULT_TOKENS
+
+
+class SpeakerDiarizationParser:
+    """Parser for speaker diarization LLM output"""
+
+    def parse(self, text: str) -> Dict[str, Any]:
+        """Parse LLM response into structured speaker data"""
+        try:
+            # Try to extract JSON from the response
+            json_match = re.search(r"\{.*\}", text, re.DOTALL)
+            if json_match:
+                return json.loads(json_match.group())
+            else:
+                # Fallback parsing if no JSON found
+                return {"error": "Could not parse LLM response", "raw_response": text}
+        except json.JSONDecodeError:
+            return {"error": "Invalid JSON in LLM response", "raw_response": text}
+
+
+class DiarizationAgent:
+    def __init__(self, state_manager, recover: bool = True, max_retries: int = 2, retry_backoff: float = 1.0, early_stop: bool = False):
+        self.state_manager = state_manager
+        self.parser = SpeakerDiarizationParser()
+        self.ollama_client = get_ollama_client(state_manager)
+        self.metrics = get_metrics(state_manager)
+        # recover: retry failed windows, then split them, instead of aborting the whole run
+        self.recover = recover
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        # early_stop: stream responses and cancel generation once the JSON object is closed
+        self.stop = JSON_STOP if early_stop else None
+        # Optional DependencyRecord: windows whose segments are unchanged reuse their recorded labels
+        self.dependency_record = None
+        self._stats_lock = threading.Lock()
+        self.reset_recovery_stats()
+
 
-            # Format segments for the prompt
-            segments_text = ""
-            for i, seg in enumerate(chunk):
-                segments_text += f"Segment {chunk_start + i}: [{seg['start']:.1f}s-{seg['end']:.1f}s] \"{seg['text']}\"\n"
+    def analyze_speakers(
+        self,
+        segments: List[Dict],
+        chunk_size: int = 8,
+        context_overlap: int = 0,
+        max_workers: int = 1,
+        context_weight: float = 0.5,
+        token_budget: int = None,
+        max_chunk_size: int = 40,
+    ) -> List[Dict]:
+        """
+        Analyze transcript segments to identify speakers with confidence scores, in chunks.
 
-            prompt = prompt_template.format(
-                transcript=transcript_text, segments=segments_text
+        Each chunk is sent together with up to context_overlap neighbouring segments on
+        either side, and the LLM labels the whole window. A segment labelled by several
+        windows gets one label by confidence-weighted voting, with votes cast as context
+        weighted by context_weight. Up to max_workers windows are analyzed concurrently.
+        With token_budget set, chunk sizes adapt to segment length (see plan_windows).
+        """
+        self.reset_recovery_stats()
+        total_segments = len(segments)
+        windows = self.plan_windows(segments, chunk_size, context_overlap, token_budget=token_budget, max_chunk_size=max_chunk_size)
+
+        def label(window):
+            window_start, window_end, _, _ = window
+            params = self.window_params(window, chunk_size, context_overlap, token_budget, max_chunk_size)
+            return self.label_window(segments[window_start:window_end], window_start, total_segments, params)
+
+        if max_workers <= 1:
+            window_labels = [label(window) for window in windows]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                window_labels = list(executor.map(label, windows))
+
+        return self.combine_windows(segments, windows, window_labels, context_weight)
+
+    def plan_windows(
+        self,
+        segments: List[Dict],
+        chunk_size: int = 8,
+        context_overlap: int = 0,
+        first_chunk: int = 0,
+        token_budget: int = None,
+        max_chunk_size: int = 40,
+        complete: bool = True,
+    ):
+        """
+        Split segments into chunks; returns (window_start, window_end, chunk_start, chunk_end) tuples.
+
+        Without token_budget every chunk has chunk_size segments. With it, each chunk
+        takes segments greedily while the estimated request size (template plus the
+        chunk's segments and their results) stays within the budget, up to
+        max_chunk_size segments; context segments come on top. Pass complete=False
+        while segments are still arriving to get only the windows whose boundaries
+        and trailing context are already known.
+        """
+        windows = []
+        total_segments = len(segments)
+        chunk_start = first_chunk
+        while chunk_start < total_segments:
+            chunk_end, determined = self._chunk_end(segments, chunk_start, chunk_size, token_budget, max_chunk_size)
+            if not complete and (not determined or chunk_end + context_overlap > total_segments):
+                break
+            windows.append((
+                max(0, chunk_start - context_overlap),
+                min(total_segments, chunk_end + context_overlap),
+                chunk_start,
+                chunk_end,
+            ))
+            chunk_start = chunk_end
+        return windows
+
+    def _chunk_end(self, segments: List[Dict], chunk_start: int, chunk_size: int, token_budget: int, max_chunk_size: int):
+        """End of the chunk starting at chunk_start, and whether later segments could still extend it."""
+        total_segments = len(segments)
+        if token_budget is None:
+            chunk_end = chunk_start + chunk_size
+            return min(chunk_end, total_segments), chunk_end <= total_segments
+
+        tokens = DIARIZATION_PROMPT_TOKENS
+        chunk_end = chunk_start
+        while chunk_end < total_segments:
+            if chunk_end - chunk_start >= max_chunk_size:
+                return chunk_end, True
+            cost = segment_prompt_tokens(segments[chunk_end])
+            # A chunk always takes at least one segment, even an oversized one
+            if chunk_end > chunk_start and tokens + cost > token_budget:
+                return chunk_end, True
+            tokens += cost
+            chunk_end += 1
+        return chunk_end, False
+
+    def combine_windows(self, segments: List[Dict], windows, window_labels, context_weight: float = 0.5) -> List[Dict]:
+        """Reconcile per-window labels into one label per segment and save the analysis."""
+        votes = {i: [] for i in range(len(segments))}
+        for (_, _, chunk_start, chunk_end), labels in zip(windows, window_labels):
+            for index, item in labels.items():
+                weight = 1.0 if chunk_start <= index < chunk_end else context_weight
+                votes[index].append((item, weight))
+
+        enriched_segments, speaker_analysis = self._reconcile(segments, votes)
+        with self._stats_lock:
+            recovery = {
+                "retries": self._recovery_stats["retries"],
+                "splits": self._recovery_stats["splits"],
+                "unknown_segments": sorted(self._recovery_stats["unknown_segments"]),
+            }
+        self.save_analysis({"speaker_analysis": speaker_analysis, "summary": {}, "recovery": recovery})
+
+        return enriched_segments
+
+    def analyze_speakers_acoustic(
+        self,
+        segments: List[Dict],
+        audio_path: str = None,
+        audio=None,
+        num_speakers: Optional[int] = 2,
+    ) -> List[Dict]:
+        """
+        Identify speakers from the audio itself instead of asking the LLM per chunk.
+
+        Segments are clustered by MFCC voice embeddings computed from the 16 kHz audio,
+        then a single LLM call maps each cluster to INTERVIEWER or CANDIDATE.
+        """
+        from utils.acoustic_diarization import cluster_samples, cluster_speakers, load_wav
+
+        if audio is None:
+            if not audio_path or not os.path.exists(audio_path):
+                raise FileNotFoundError(f"Acoustic diarization needs the audio, but no array was given and {audio_path} does not exist")
+            audio = load_wav(audio_path)
+
+        print(f"🎙️  Clustering {len(segments)} segments by voice...")
+        labels, confidences = cluster_speakers(audio, segments, num_speakers=num_speakers)
+        roles = self._map_clusters_to_roles(cluster_samples(segments, labels))
+
+        enriched_segments = []
+        speaker_analysis = []
+        for index, (segment, label, confidence) in enumerate(zip(segments, labels.tolist(), confidences.tolist())):
+            enriched_segment = segment.copy()
+            enriched_segment.update(
+                {
+                    "speaker": roles.get(label, "UNKNOWN"),
+                    "confidence": round(confidence, 3),
+                    "reasoning": f"Acoustic cluster SPEAKER_{label}",
+                    "cluster": label,
+                }
             )
+            enriched_segments.append(enriched_segment)
+            speaker_analysis.append(
+                {
+                    "segment_index": index,
+                    "speaker": enriched_segment["speaker"],
+                    "confidence": enriched_segment["confidence"],
+                    "reasoning": enriched_segment["reasoning"],
+                }
+            )
+
+        self.save_analysis({
+            "speaker_analysis": speaker_analysis,
+            "summary": {"clusters": {f"SPEAKER_{label}": role for label, role in roles.items()}},
+        })
+        return enriched_segments
 
-            print(f"🤖 Analyzing speakers with LLM for segments {chunk_start + 1}-{chunk_end} of {total_segments}...")
-            llm_response = query_ollama(prompt, model="llama3.2")
-            print(f"✅ LLM response received for segments {chunk_start + 1}-{chunk_end}.")
+    def _map_clusters_to_roles(self, samples: Dict[int, List[str]]) -> Dict[int, str]:
+        """Ask the LLM once which voice cluster is the interviewer; falls back to a question-count heuristic."""
+        from utils.acoustic_diarization import default_role_mapping
 
-            # Parse the LLM response
-            parsed_result = self.parser.parse(llm_response)
+        fallback = default_role_mapping(samples)
+        if len(samples) < 2:
+            return fallback
 
-            if "error" in parsed_result:
-                print(f"⚠️  Warning: {parsed_result['error']}")
-                raise Exception("LLM diarization failed")
+        clusters_text = ""
+        for label, texts in sorted(samples.items()):
+            clusters_text += f"SPEAKER_{label}:\n" + "\n".join(f"- {text}" for text in texts) + "\n\n"
 
-            # Merge speaker info back into chunk
-            chunk_enriched = self._merge_speaker_data(chunk, parsed_result)
-            enriched_segments.extend(chunk_enriched)
-            all_parsed_results["speaker_analysis"].extend(parsed_result.get("speaker_analysis", []))
+        prompt = f"""
+The following job interview was split into speakers by voice. Each speaker's sample utterances are listed below.
 
-        # Save analysis to state
+{clusters_text}
+Decide which speaker is the INTERVIEWER (asks the questions) and which are CANDIDATE (answers them).
+Return ONLY a JSON object mapping each speaker to its role, for example:
+{{"SPEAKER_0": "INTERVIEWER", "SPEAKER_1": "CANDIDATE"}}
+"""
+        print(f"🤖 Mapping {len(samples)} voice clusters to interview roles with LLM...")
+        parsed = self.parser.parse(query_ollama(prompt, model=DIARIZATION_MODEL, client=self.ollama_client, metrics=self.metrics, stop=self.stop))
+        if "error" in parsed:
+            print(f"⚠️  Warning: {parsed['error']}, using question-count heuristic")
+            return fallback
+
+        roles = {}
+        for label in samples:
+            role = str(parsed.get(f"SPEAKER_{label}", "")).upper()
+            roles[label] = role if role in ("INTERVIEWER", "CANDIDATE") else fallback[label]
+        return roles
+
+    def save_analysis(self, all_parsed_results: Dict):
+        """Save the combined speaker analysis to state."""
         self.state_manager.set_state("speaker_analysis", all_parsed_results)
+        self.state_manager.set_state("diarization_recovery", all_parsed_results.get("recovery"))
         self.state_manager.set_state("diarization_completed", True)
 
-        return enriched_segments
+    def reset_recovery_stats(self):
+        """Reset the retry/split counters before analyzing a new set of segments."""
+        with self._stats_lock:
+            self._recovery_stats = {"retries": 0, "splits": 0, "unknown_segments": set()}
 
-    def _merge_speaker_data(self, segments: List[Dict], analysis: Dict) -> List[Dict]:
-        """Merge speaker analysis back into segment data"""
-        enriched_segments = []
+    def window_params(self, window, chunk_size: int = 8, context_overlap: int = 0, token_budget: int = None, max_chunk_size: int = 40) -> Dict[str, Any]:
+        """The options a planned window was built with, including how many context segments it has on each side."""
+        window_start, window_end, chunk_start, chunk_end = window
+        return {
+            "chunk_size": chunk_size,
+            "context_overlap": context_overlap,
+            "token_budget": token_budget,
+            "max_chunk_size": max_chunk_size,
+            "context": [chunk_start - window_start, window_end - chunk_end],
+        }
+
+    def label_window(self, window: List[Dict], window_start: int, total_segments: int = None, params: Dict[str, Any] = None) -> Dict[int, Dict]:
+        """
+        Label one window of segments, reusing the recorded labels when its segments are unchanged.
+
+        params (see window_params) are part of the record key along with the model
+        and stop condition, so changing any of them labels the window again.
+        """
+        record = self.dependency_record
+        if record is None:
+            return self._label_window(window, window_start, total_segments)
 
-        speaker_data = {
-            item["segment_index"]: item for item in analysis.get("speaker_analysis", [])
+        inputs = [segment_hash(seg, ("start", "end", "text")) for seg in window]
+        params = {
+            "model": DIARIZATION_MODEL,
+            "backend": "llm",
+            "stop": getattr(self.stop, "key", None),
+            **(params or {}),
         }
+        recorded = record.lookup("diarization", inputs, params)
+        if recorded is not None:
+            return {window_start + int(offset): dict(item) for offset, item in recorded.items()}
+
+        labels = self._label_window(window, window_start, total_segments)
+        # Only fully labelled windows are recorded, so failed segments are retried next time
+        if len(labels) == len(window):
+            record.store("diarization", inputs, {str(index - window_start): dict(item) for index, item in labels.items()}, params)
+        return labels
+
+    def _label_window(self, window: List[Dict], window_start: int, total_segments: int = None) -> Dict[int, Dict]:
+        """
+        Label one window of segments, recovering from failures when enabled.
+
+        A failing window is retried with exponential backoff, then split in half and
+        each half labelled separately. A single segment that still fails is left
+        unlabelled, so it ends up UNKNOWN; every other result is kept.
+        """
+        if not self.recover:
+            return self._query_window(window, window_start, total_segments)
+
+        window_end = window_start + len(window)
+        for attempt in range(self.max_retries + 1):
+            try:
+                # A response that fails to parse is dropped from the cache, so a retry asks the model again
+                return self._query_window(window, window_start, total_segments)
+            except Exception as e:
+                if attempt < self.max_retries:
+                    delay = self.retry_backoff * 2 ** attempt
+                    print(f"🔁 Retrying segments {window_start + 1}-{window_end} in {delay:.1f}s ({e})")
+                    self._count_recovery("retries")
+                    time.sleep(delay)
+
+        if len(window) > 1:
+            mid = len(window) // 2
+            print(f"✂️  Splitting segments {window_start + 1}-{window_end} after repeated failures")
+            self._count_recovery("splits")
+            labels = self._label_window(window[:mid], window_start, total_segments)
+            labels.update(self._label_window(window[mid:], window_start + mid, total_segments))
+            return labels
+
+        print(f"⚠️  Giving up on segment {window_start + 1}, marking it UNKNOWN")
+        with self._stats_lock:
+            self._recovery_stats["unknown_segments"].add(window_start)
+        return {}
+
+    def _count_recovery(self, key: str):
+        with self._stats_lock:
+            self._recovery_stats[key] += 1
+
+    def _query_window(self, window: List[Dict], window_start: int, total_segments: int = None, use_cache: bool = True) -> Dict[int, Dict]:
+        """Ask the LLM to label one window of segments; returns {global segment index: label entry}."""
+        window_end = window_start + len(window)
+        of_total = f" of {total_segments}" if total_segments is not None else ""
+
+        # Format segments for the prompt
+        segments_text = ""
+        for i, seg in enumerate(window):
+            segments_text += f"Segment {window_start + i}: [{seg['start']:.1f}s-{seg['end']:.1f}s] \"{seg['text']}\"\n"
+
+        prompt = get_diarization_prompt().format(segments=segments_text)
 
-        for i, segment in enumerate(segments):
+        print(f"🤖 Analyzing speakers with LLM for segments {window_start + 1}-{window_end}{of_total}...")
+        llm_response = query_ollama(prompt, model=DIARIZATION_MODEL, client=self.ollama_client, use_cache=use_cache, stop=self.stop, metrics=self.metrics)
+        print(f"✅ LLM response received for segments {window_start + 1}-{window_end}.")
+
+        # Parse the LLM response
+        parsed_result = self.parser.parse(llm_response)
+
+        if "error" in parsed_result:
+            print(f"⚠️  Warning: {parsed_result['error']}")
+            if use_cache:
+                # Otherwise retries and later runs would replay the unparseable response
+                forget_response(prompt, model=DIARIZATION_MODEL, stop=self.stop)
+            raise Exception("LLM diarization failed")
+
+        # The prompt numbers segments globally, so keep entries that fall inside this window
+        labels = {}
+        for item in parsed_result.get("speaker_analysis", []):
+            try:
+                index = int(item["segment_index"])
+                item["confidence"] = float(item["confidence"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if window_start <= index < window_end and item.get("speaker"):
+                labels[index] = item
+        return labels
+
+    def _reconcile(self, segments: List[Dict], votes: Dict[int, List]):
+        """
+        Merge speaker votes back into segment data, one label per segment.
+
+        The speaker with the highest total weighted confidence wins. The reported
+        confidence is the winners' weighted mean confidence scaled by their share
+        of the vote, so a single vote keeps the LLM's own confidence.
+        """
+        enriched_segments = []
+        speaker_analysis = []
+        with self._stats_lock:
+            failed = set(self._recovery_stats["unknown_segments"])
+
+        for index, segment in enumerate(segments):
             enriched_segment = segment.copy()
+            segment_votes = votes.get(index, [])
+
+            if segment_votes:
+                scores = {}
+                for item, weight in segment_votes:
+                    scores[item["speaker"]] = scores.get(item["speaker"], 0.0) + weight * item["confidence"]
+                speaker = max(scores, key=scores.get)
+
+                winners = [(item, weight) for item, weight in segment_votes if item["speaker"] == speaker]
+                winner_weight = sum(weight for _, weight in winners)
+                total_weight = sum(weight for _, weight in segment_votes)
+                mean_confidence = sum(weight * item["confidence"] for item, weight in winners) / winner_weight
+                best = max(winners, key=lambda vote: vote[1] * vote[0]["confidence"])[0]
 
-            if i in speaker_data:
-                speaker_info = speaker_data[i]
                 enriched_segment.update(
                     {
-                        "speaker": speaker_info["speaker"],
-                        "confidence": speaker_info["confidence"],
-                        "reasoning": speaker_info.get("reasoning", ""),
+                        "speaker": speaker,
+                        "confidence": round(mean_confidence * winner_weight / total_weight, 3),
+                        "reasoning": best.get("reasoning", ""),
+                    }
+                )
+                speaker_analysis.append(
+                    {
+                        "segment_index": index,
+                        "speaker": speaker,
+                        "confidence": enriched_segment["confidence"],
+                        "reasoning": enriched_segment["reasoning"],
+                        "votes": len(segment_votes),
                     }
                 )
             else:
@@ -146,10 +486,10 @@ Return ONLY a JSON object in this exact format:
                     {
                         "speaker": "UNKNOWN",
                         "confidence": 0.5,
-                        "reasoning": "Not analyzed by LLM",
+                        "reasoning": "LLM diarization failed" if index in failed else "Not analyzed by LLM",
                     }
                 )
 
             enriched_segments.append(enriched_segment)
 
-        return enriched_segments
+        return enriched_segments, speaker_analysis
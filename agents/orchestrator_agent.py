@@ -1,65 +1,69 @@
 
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from agents.audio_extraction_agent import AudioExtractionAgent
 from agents.transcription_agent import TranscriptionAgent
-from agents.sentiment_analysis_agent import SentimentAnalysisAgent
-from langchain.schema.runnable import RunnableLambda
-
-def make_audio_extraction_runnable(audio_agent):
-    return RunnableLambda(lambda inputs: {
-        "audio_path": audio_agent.run(inputs["video_path"])
-    })
-
-def make_transcription_runnable(transcription_agent):
-    return RunnableLambda(lambda inputs: {
-        "transcript_data": transcription_agent.run(inputs["audio_path"])
-    })
-
-def make_audio_extraction_runnable(audio_agent):
-    return RunnableLambda(lambda inputs: {
-        "audio_path": audio_agent.run(inputs["video_path"])
-    })
-
-def make_transcription_runnable(transcription_agent):
-    return RunnableLambda(lambda inputs: {
-        "transcript_data": transcription_agent.run(inputs["audio_path"])
-    })
+from agents.sentiment_analysis_agent import SegmentBatcher, SentimentAnalysisAgent
+from agents.summarization_agent import SummarizationAgent
+from agents.audio_extraction_agent import SAMPLE_RATE
+from utils.artifact_cache import ArtifactCache, DEFAULT_ARTIFACT_DIR, content_sha256, file_sha256
+from utils.audio_utils import WINDOW_SECONDS, transcript_from_segments
+from utils.dependency_record import DependencyRecord, analysis_record_path, interview_base_name
+from utils.metrics import get_metrics
+from utils.segment_store import iter_segments
+from utils.whisper_models import preload_whisper_model
 
 
 class OrchestratorAgent:
 
-    def __init__(self, state):
+    def __init__(self, state, in_memory_audio: bool = False, save_wav: bool = True, use_cache: bool = True, cache_dir: str = DEFAULT_ARTIFACT_DIR, overlap_llm: bool = False, llm_workers: int = 4, context_overlap: int = 0, diarization_backend: str = "llm", diarization_token_budget: int = None, summary_token_budget: int = None, sentiment_batch_token_budget: int = None, early_stop: bool = False):
         self.state = state
-        self.audio_agent = AudioExtractionAgent(state)
-        self.transcription_agent = TranscriptionAgent(state)
-        self.sentiment_agent = SentimentAnalysisAgent(state)
+        self.audio_agent = AudioExtractionAgent(state, in_memory=in_memory_audio, save_wav=save_wav)
+        # early_stop: stream LLM responses and cancel generation once the label or JSON is complete
+        self.transcription_agent = TranscriptionAgent(state, early_stop=early_stop)
+        self.sentiment_agent = SentimentAnalysisAgent(state, early_stop=early_stop)
+        self.early_stop = early_stop
+        self.summarization_agent = SummarizationAgent(state)
+        # Per-run timings and LLM/Whisper statistics, shared with the agents through the state
+        self.metrics = get_metrics(state)
+        # Stage outputs are cached so a rerun resumes from the first missing or invalid stage
+        self.artifact_cache = ArtifactCache(cache_dir) if use_cache else None
+        # Per-interview record of LLM results by input segment content, so edits only recompute what they touch
+        self.use_dependency_record = use_cache
+        self.dependency_record = None
+        self.model_size = "base"
+        self.chunk_size = 8
+        # Neighbouring segments sent as context on each side of a diarization chunk
+        self.context_overlap = context_overlap
+        # "llm" labels text chunks with the LLM; "acoustic" clusters voices and uses the LLM once
+        self.diarization_backend = diarization_backend
+        # Size diarization chunks by estimated request tokens instead of a fixed segment count
+        self.diarization_token_budget = diarization_token_budget
+        # Summarize long interviews in map-reduce rounds that each fit this many tokens
+        self.summary_token_budget = summary_token_budget
+        # Pack several segments into each sentiment prompt, up to this many estimated tokens
+        self.sentiment_batch_token_budget = sentiment_batch_token_budget
+        # overlap_llm: start diarization and sentiment LLM calls while Whisper is still decoding
+        self.overlap_llm = overlap_llm
+        self.llm_workers = llm_workers
 
     def run(self, video_path: str):
         print("\n🚀 Starting multi-speaker analysis pipeline...\n")
 
-        audio_runnable = make_audio_extraction_runnable(self.audio_agent)
-        transcription_runnable = make_transcription_runnable(self.transcription_agent)
-        chain = audio_runnable | transcription_runnable
-
-        # Run the chain
-        result = chain.invoke({"video_path": video_path})
-        transcript_data = result["transcript_data"]
-        audio_path = result.get("audio_path", self.state.get_state("audio_path") or "(not set)")
-
-        # Sentiment analysis step (LLM, segment-based)
-        segments_json_file = self.state.get_state('segments_json_file') or "data/interview_segments.json"
-        sentiment_md_path = f"sentiment_results_{os.path.splitext(os.path.basename(video_path))[0]}.md"
-        sentiment_md = self.sentiment_agent.run(
-            transcript_text=transcript_data['text'],
-            segments_path=segments_json_file,
-            output_md_path=sentiment_md_path
-        )
-
-        # Set summary/analysis report, language, and total segments in state for ACCESS YOUR DATA
-        self.state.set_state('summary_json_file', None)  # Placeholder, set to actual summary if available
-        self.state.set_state('summary_text_file', None)  # Placeholder, set to actual analysis if available
-        self.state.set_state('language', transcript_data.get('language'))
-        self.state.set_state('total_segments', len(transcript_data.get('segments', [])))
+        keys = self.stage_keys(video_path)
+        resumed = [stage for stage, key in (self.state.get_state("completed_stages") or {}).items() if keys.get(stage) == key]
+        if resumed:
+            print(f"♻️  Resuming run; completed stages: {', '.join(resumed)}\n")
+        if self.overlap_llm:
+            transcript_data = self.overlapped_analysis_stage(video_path, keys)
+        else:
+            extraction = self.extraction_stage(video_path, keys)
+            transcript_data = self.transcription_stage(video_path, keys, extraction)
+            transcript_data = self.analysis_stage(video_path, keys, transcript_data)
+        audio_path = transcript_data["audio_path"]
+        sentiment_md_path = self.state.get_state('sentiment_md_file')
+        metrics_path = self.save_metrics(video_path)
 
         # Print summary
         print("📊 PIPELINE SUMMARY:")
@@ -72,7 +76,391 @@ class OrchestratorAgent:
         print(f"📏 Transcript length: {len(transcript_data['text'])} characters")
         print(f"🔢 Number of segments: {len(transcript_data['segments'])}")
         print(f"📄 Sentiment markdown file: {sentiment_md_path}")
+        print(f"📊 Summary report: {self.state.get_state('summary_json_file')}")
+        print(f"📑 Analysis report: {self.state.get_state('summary_text_file')}")
+        print(f"📈 Metrics file: {metrics_path}")
         print("=" * 50)
 
         print("✅ All data saved to state management. Pipeline completed successfully!")
         return True  # Simple success indicator
+
+    def stage_keys(self, video_path: str):
+        """Derive each stage's cache key from the video content and the stage parameters."""
+        if self.artifact_cache is None:
+            return {}
+
+        cache = self.artifact_cache
+        keys = {}
+        keys["extraction"] = cache.key("extraction", file_sha256(video_path), {
+            "video_path": os.path.abspath(video_path),
+            "sample_rate": SAMPLE_RATE,
+            "channels": 1,
+        })
+        # Both paths decode window by window, so they share the transcription artifact
+        keys["transcription"] = cache.key("transcription", keys["extraction"], {
+            "model_size": self.model_size,
+            "window_seconds": WINDOW_SECONDS,
+        })
+        keys["diarization"] = cache.key("diarization", keys["transcription"], {
+            "backend": self.diarization_backend,
+            **self._window_options(),
+        })
+        return keys
+
+    def extraction_stage(self, video_path: str, keys):
+        """Extract audio (ffmpeg). Returns None when a later stage is already cached."""
+        if self._has_artifact("diarization", keys) or self._has_artifact("transcription", keys):
+            return None
+
+        # Only a freshly run in-memory extraction provides an audio array; otherwise read the WAV
+        self.state.set_state("audio_array", None)
+        extraction = self._run_stage(
+            "extraction", keys, lambda: self._extract(video_path), validate=self._valid_audio
+        )
+        self.state.set_state("audio_path", extraction["audio_path"])
+        return extraction
+
+    def transcription_stage(self, video_path: str, keys, extraction=None):
+        """Transcribe audio (Whisper). Returns None when diarization is already cached."""
+        if self._has_artifact("diarization", keys):
+            return None
+
+        def transcribe():
+            audio = extraction or self.extraction_stage(video_path, keys)
+            return self.transcription_agent.transcribe(audio["audio_path"], model_size=self.model_size)
+
+        return self._run_stage("transcription", keys, transcribe)
+
+    def analysis_stage(self, video_path: str, keys, transcript_data=None):
+        """Run the LLM stages (diarization, sentiment) and write the reports."""
+        self._attach_dependency_record(video_path)
+
+        def diarize():
+            raw = transcript_data or self.transcription_stage(video_path, keys)
+            if self.diarization_backend == "acoustic":
+                self._ensure_audio(video_path, raw["audio_path"])
+            return {
+                "transcript_data": self.transcription_agent.diarize(raw, **self._diarization_options()),
+                "speaker_analysis": self.state.get_state("speaker_analysis"),
+            }
+
+        diarization = self._run_stage("diarization", keys, diarize)
+        return self._report_stage(
+            video_path, keys, diarization,
+            lambda segments_json_file: self.sentiment_agent.run(
+                transcript_text=diarization["transcript_data"]['text'],
+                segments_path=segments_json_file,
+                max_workers=self.llm_workers,
+                batch_token_budget=self.sentiment_batch_token_budget,
+                summary_token_budget=self.summary_token_budget,
+            )
+        )
+
+    def overlapped_analysis_stage(self, video_path: str, keys, extraction=None):
+        """
+        Run transcription and the LLM stages as producer and consumers.
+
+        Segments streamed from Whisper are sent for sentiment straight away, and each
+        diarization window is sent as soon as its chunk and trailing context segments
+        have been decoded, so LLM calls overlap with decoding. Decoding, chunking and
+        prompts match the sequential path, so the outputs are the same.
+        """
+        if self._has_artifact("diarization", keys):
+            return self.analysis_stage(video_path, keys)
+        self._attach_dependency_record(video_path)
+
+        with self.metrics.stage("overlapped_analysis"):
+            diarization, segment_results = self._overlapped_diarization(video_path, keys, extraction)
+
+        return self._report_stage(
+            video_path, keys, diarization,
+            lambda segments_json_file: self.sentiment_agent.build_report(
+                segment_results, summary_token_budget=self.summary_token_budget, max_workers=self.llm_workers
+            )
+        )
+
+    def _overlapped_diarization(self, video_path: str, keys, extraction=None):
+        """
+        Stream transcription into concurrent diarization and sentiment calls; returns (diarization, sentiment results).
+
+        The sentiment results are empty when the sentiment report is already cached.
+        """
+        cached = self.artifact_cache.load("transcription", keys["transcription"]) if self.artifact_cache else None
+        if cached is not None:
+            print("♻️  Reusing cached transcription output")
+            info = {"language": cached["language"], "audio_path": cached["audio_path"]}
+            source = iter(cached["segments"])
+        else:
+            extraction = extraction or self.extraction_stage(video_path, keys)
+            info = {}
+            source = self.transcription_agent.stream(extraction["audio_path"], model_size=self.model_size, info=info)
+
+        # With the segments known up front, a cached sentiment report makes the sentiment calls unnecessary
+        analyze_sentiment = True
+        if cached is not None:
+            keys["sentiment"] = self._sentiment_key(cached["segments"])
+            analyze_sentiment = not self._has_artifact("sentiment", keys)
+
+        diarization_agent = self.transcription_agent.diarization_agent
+        diarization_agent.reset_recovery_stats()
+        # Acoustic diarization needs the whole recording, so only sentiment overlaps with decoding
+        acoustic = self.diarization_backend == "acoustic"
+        # With a batch budget, segments are packed into sentiment prompts as they arrive
+        batcher = SegmentBatcher(self.sentiment_batch_token_budget) if self.sentiment_batch_token_budget else None
+        segments = []
+        windows = []
+        window_futures = []
+        sentiment_futures = []
+
+        def submit_windows(planned):
+            for window in planned:
+                window_start, window_end, _, _ = window
+                windows.append(window)
+                window_futures.append(pool.submit(
+                    diarization_agent.label_window, segments[window_start:window_end], window_start,
+                    params=diarization_agent.window_params(window, **self._window_options()),
+                ))
+
+        with ThreadPoolExecutor(max_workers=self.llm_workers) as pool:
+            next_chunk = 0
+            started = time.perf_counter()
+            for i, seg in enumerate(source):
+                segments.append(seg)
+                # Sentiment prompts only need the segment text, so they go out immediately (or once their batch is full)
+                if analyze_sentiment:
+                    batch = batcher.add(i, seg) if batcher else [(i, seg)]
+                    if batch:
+                        sentiment_futures.append(pool.submit(self.sentiment_agent.analyze_batch, batch))
+                # A window is ready once its chunk boundary and trailing context segments are known
+                if not acoustic:
+                    ready = diarization_agent.plan_windows(
+                        segments, first_chunk=next_chunk, complete=False, **self._window_options()
+                    )
+                    if ready:
+                        submit_windows(ready)
+                        next_chunk = ready[-1][3]
+            if cached is None and info.get("audio_duration"):
+                # Decoding time includes handing segments to the pool, which does not block
+                self.metrics.record_transcription(info["audio_duration"], time.perf_counter() - started, self.model_size)
+            last_batch = batcher.flush() if analyze_sentiment and batcher else None
+            if last_batch:
+                sentiment_futures.append(pool.submit(self.sentiment_agent.analyze_batch, last_batch))
+            # The remaining chunks are planned against the final segment count, as in the sequential path
+            if not acoustic:
+                submit_windows(diarization_agent.plan_windows(
+                    segments, first_chunk=next_chunk, **self._window_options()
+                ))
+
+            window_labels = [future.result() for future in window_futures]
+            segment_results = [r for future in sentiment_futures for r in future.result()]
+
+        transcript_data = transcript_from_segments(segments, info)
+        if cached is None and self.artifact_cache is not None:
+            self.artifact_cache.save("transcription", keys["transcription"], transcript_data)
+
+        if acoustic:
+            self._ensure_audio(video_path, transcript_data["audio_path"])
+            enriched_segments = self.transcription_agent.diarize(transcript_data, backend="acoustic")["segments"]
+        else:
+            enriched_segments = diarization_agent.combine_windows(segments, windows, window_labels)
+
+        diarization = {
+            "transcript_data": {**transcript_data, "segments": enriched_segments},
+            "speaker_analysis": self.state.get_state("speaker_analysis"),
+        }
+        if self.artifact_cache is not None:
+            self.artifact_cache.save("diarization", keys["diarization"], diarization)
+        return diarization, segment_results
+
+    def _report_stage(self, video_path: str, keys, diarization, run_sentiment):
+        """
+        Save diarized transcripts, produce (or restore) the sentiment and summary reports and record outputs in state.
+
+        Both reports only read the diarized segments, so they are produced concurrently.
+        """
+        transcript_data = diarization["transcript_data"]
+        self.state.set_state("speaker_analysis", diarization["speaker_analysis"])
+        self.state.set_state("diarization_recovery", (diarization["speaker_analysis"] or {}).get("recovery"))
+        self.state.set_state("diarization_completed", True)
+        self.state.set_state("audio_path", transcript_data["audio_path"])
+        self.transcription_agent.save(transcript_data)
+
+        # Sentiment analysis (LLM, segment-based) and interview summary (LLM, topic-based)
+        segments_json_file = (
+            self.state.get_state('segments_jsonl_file')
+            or self.state.get_state('segments_json_file')
+            or "data/interview_segments.json"
+        )
+        base_name = os.path.splitext(video_path)[0]
+        # Written next to the recording, so same-named files in different folders keep their own report
+        sentiment_md_path = f"{base_name}_sentiment_results.md"
+        if self.artifact_cache is not None:
+            # Keyed on the diarized segments themselves, since that is what both reports read
+            segments_sha256 = content_sha256(transcript_data["segments"])
+            keys["sentiment"] = self._sentiment_key(transcript_data["segments"])
+            keys["summary"] = self.artifact_cache.key("summary", segments_sha256, {"topics": sorted(self.summarization_agent.key_topics)})
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            sentiment_future = executor.submit(
+                self._run_stage, "sentiment", keys, lambda: {"markdown": run_sentiment(segments_json_file)}
+            )
+            summary_future = executor.submit(
+                self._run_stage, "summary", keys, lambda: self.summarization_agent.analyze_interview(segments_json_file)
+            )
+            sentiment = sentiment_future.result()
+            summary_report = summary_future.result()
+
+        with open(sentiment_md_path, 'w') as f:
+            f.write(sentiment["markdown"])
+        self.state.set_state('sentiment_md_file', sentiment_md_path)
+        self.summarization_agent.save(
+            summary_report,
+            json_path=f"{base_name}_summary_report.json",
+            text_path=f"{base_name}_analysis_report.txt",
+        )
+
+        # Set language and total segments in state for ACCESS YOUR DATA
+        self.state.set_state('language', transcript_data.get('language'))
+        self.state.set_state('total_segments', len(transcript_data.get('segments', [])))
+        self._save_dependency_record()
+        return transcript_data
+
+    def _sentiment_key(self, segments):
+        """The sentiment report only reads the segment texts, so speaker labels do not change its key."""
+        texts_sha256 = content_sha256([seg["text"] for seg in segments])
+        return self.artifact_cache.key("sentiment", texts_sha256, {
+            "mode": "overlapped" if self.overlap_llm else "per_segment",
+            "summary_token_budget": self.summary_token_budget,
+            "batch_token_budget": self.sentiment_batch_token_budget,
+            "early_stop": self.early_stop,
+        })
+
+    def reanalyze(self, segments_path: str):
+        """
+        Rebuild the sentiment and summary reports from an edited segments file.
+
+        Reviewers' corrections to text or speaker labels are taken as they are
+        (diarization is not rerun). Only LLM results whose input segments changed
+        since the last run are recomputed; everything else comes from the
+        interview's dependency record.
+        """
+        print(f"\n🔁 Re-analyzing {segments_path}...\n")
+        self._attach_dependency_record(segments_path)
+        # Only the texts are needed here; the agents read the file themselves
+        texts = [seg["text"] for seg in iter_segments(segments_path)]
+        base_name = interview_base_name(segments_path)
+        sentiment_md_path = f"{base_name}_sentiment_results.md"
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            sentiment_future = executor.submit(
+                self.sentiment_agent.run,
+                transcript_text=" ".join(texts),
+                segments_path=segments_path,
+                output_md_path=sentiment_md_path,
+                max_workers=self.llm_workers,
+                batch_token_budget=self.sentiment_batch_token_budget,
+                summary_token_budget=self.summary_token_budget,
+            )
+            summary_future = executor.submit(
+                self.summarization_agent.run,
+                segments_path,
+                json_path=f"{base_name}_summary_report.json",
+                text_path=f"{base_name}_analysis_report.txt",
+            )
+            sentiment_future.result()
+            summary_future.result()
+
+        self.state.set_state('total_segments', len(texts))
+        self._save_dependency_record()
+        return True
+
+    def _attach_dependency_record(self, path: str):
+        """Load the interview's dependency record and hand it to the LLM agents."""
+        if not self.use_dependency_record:
+            return None
+        self.dependency_record = DependencyRecord(analysis_record_path(path))
+        self.sentiment_agent.dependency_record = self.dependency_record
+        self.summarization_agent.dependency_record = self.dependency_record
+        self.transcription_agent.diarization_agent.dependency_record = self.dependency_record
+        return self.dependency_record
+
+    def _save_dependency_record(self):
+        record = self.dependency_record
+        if record is None:
+            return
+        for stage, counts in record.summary().items():
+            print(f"♻️  {stage}: reused {counts['reused']}, recomputed {counts['computed']}")
+        record.save()
+        self.state.set_state("dependency_record_file", record.path)
+
+    def save_metrics(self, video_path: str) -> str:
+        """Write this run's metrics next to the video as JSON and Prometheus text."""
+        base_name = os.path.splitext(video_path)[0]
+        metrics_path = self.metrics.save(f"{base_name}_metrics.json", f"{base_name}_metrics.prom")
+        self.state.set_state("metrics_file", metrics_path)
+        return metrics_path
+
+    def _window_options(self):
+        return {
+            "chunk_size": self.chunk_size,
+            "context_overlap": self.context_overlap,
+            "token_budget": self.diarization_token_budget,
+        }
+
+    def _diarization_options(self):
+        if self.diarization_backend == "acoustic":
+            return {"backend": "acoustic"}
+        return {**self._window_options(), "max_workers": self.llm_workers}
+
+    def _has_artifact(self, stage: str, keys) -> bool:
+        return self.artifact_cache is not None and self.artifact_cache.load(stage, keys[stage]) is not None
+
+    def _run_stage(self, stage: str, keys, compute, validate=None):
+        """Return a stage's cached artifact if still valid, otherwise compute and store it."""
+        if self.artifact_cache is None:
+            with self.metrics.stage(stage):
+                return compute()
+
+        artifact = self.artifact_cache.load(stage, keys[stage])
+        if artifact is not None and (validate is None or validate(artifact)):
+            print(f"♻️  Reusing cached {stage} output")
+            self.metrics.increment(f"{stage}_cache_hits")
+            self._checkpoint(stage, keys[stage])
+            return artifact
+
+        with self.metrics.stage(stage):
+            artifact = compute()
+        self.artifact_cache.save(stage, keys[stage], artifact)
+        self._checkpoint(stage, keys[stage])
+        return artifact
+
+    def _checkpoint(self, stage: str, key: str):
+        """Record a finished stage in the state; with a persistent state this survives a crash."""
+        self.state.update_state_with(lambda state: {
+            "completed_stages": {**(state.get("completed_stages") or {}), stage: key},
+        })
+
+    def _extract(self, video_path: str):
+        # Load the Whisper model in the background while ffmpeg extracts audio
+        preload_whisper_model(self.model_size)
+        audio_path = self.audio_agent.run(video_path)
+        audio_sha256 = file_sha256(audio_path) if os.path.exists(audio_path) else None
+        return {"audio_path": audio_path, "audio_sha256": audio_sha256}
+
+    def _ensure_audio(self, video_path: str, audio_path: str):
+        """
+        Make the audio available for acoustic diarization.
+
+        A transcription restored from the cache comes without the in-memory audio,
+        and with save_wav=False there is no WAV to read either, so extract it again.
+        """
+        if self.state.get_state("audio_array") is not None or os.path.exists(audio_path):
+            return
+        print("🎵 Audio not available after a cached transcription, extracting it again for acoustic diarization...")
+        self.audio_agent.run(video_path)
+
+    def _valid_audio(self, artifact):
+        """A cached extraction is only usable if its WAV still exists with the same content."""
+        audio_path = artifact["audio_path"]
+        audio_sha256 = artifact.get("audio_sha256")
+        return audio_sha256 is not None and os.path.exists(audio_path) and file_sha256(audio_path) == audio_sha256
@@ -1,58 +1,159 @@
 
 import os
 import json
-from utils.ollama import query_ollama
+import re
+from concurrent.futures import ThreadPoolExecutor
+from utils.metrics import get_metrics
+from utils.ollama import query_ollama, get_ollama_client, is_llm_error, AnyStop, StopAfterTokens, StopOnJsonClosed, StopOnLabel
+from utils.dependency_record import segment_hash
+from utils.segment_store import count_segments, iter_segments
+from utils.segment_table import segment_table
+from utils.token_utils import estimate_tokens
+
+
+SENTIMENT_MODEL = "llama3.2"
+SENTIMENT_LABELS = ["Positive", "Negative", "Neutral"]
+
+_LABELS = "|".join(SENTIMENT_LABELS)
+# The prompt asks for the label first: "Positive - ...", "**Sentiment:** Negative", "1. Neutral: ..."
+LEADING_LABEL_PATTERN = re.compile(rf"^[\W\d]*(?:sentiment\W*(?:is\W*)?)?({_LABELS})\b", re.IGNORECASE)
+STATED_LABEL_PATTERN = re.compile(rf"\bsentiment\W*(?:is\W*)?({_LABELS})\b", re.IGNORECASE)
+# A label as a whole word, and whether it is negated ("not negative", "isn't negative")
+ANY_LABEL_PATTERN = re.compile(rf"(\bnot\s+|n't\s+)?\b({_LABELS})\b", re.IGNORECASE)
+
+
+def parse_sentiment_label(text: str) -> str:
+    """
+    The sentiment label of a single-segment response.
+
+    Taken from the start of the response, or from an explicit "Sentiment: X";
+    otherwise the one label mentioned without negation. Anything else is Neutral.
+    """
+    match = LEADING_LABEL_PATTERN.match(text) or STATED_LABEL_PATTERN.search(text)
+    if match:
+        return match.group(1).capitalize()
+    mentioned = {label.capitalize() for negation, label in ANY_LABEL_PATTERN.findall(text) if not negation}
+    return mentioned.pop() if len(mentioned) == 1 else "Neutral"
+
+
+# Prompt overhead of the batch instructions, in estimated tokens
+BATCH_PROMPT_OVERHEAD_TOKENS = 120
+# Estimated output tokens per segment in a batch response
+BATCH_TOKENS_PER_RESULT = 40
+# Smallest per-item budget when packing summary windows, even if the prompt alone exceeds the budget
+MIN_PACK_ITEM_TOKENS = 32
+
+# Early-stop conditions: the label and one sentence of explanation, or the closed JSON array
+SEGMENT_STOP = AnyStop(StopOnLabel(SENTIMENT_LABELS, sentences=1), StopAfterTokens(120))
+BATCH_STOP = StopOnJsonClosed()
+
+
+
+class SegmentBatcher:
+    """
+    Greedily group (index, segment) pairs as they arrive so each batch prompt stays within the token budget.
+
+    A batch is closed when the next segment would overflow it, so feeding segments
+    one at a time gives the same batches as packing them all at once.
+    """
+
+    def __init__(self, token_budget: int, max_batch_size: int = 32):
+        self.token_budget = token_budget
+        self.max_batch_size = max_batch_size
+        self.current = []
+        self.current_tokens = BATCH_PROMPT_OVERHEAD_TOKENS
+
+    def add(self, i, seg):
+        """Add a segment; returns the previous batch when this segment does not fit in it, otherwise None."""
+        cost = estimate_tokens(seg['text']) + BATCH_TOKENS_PER_RESULT
+        full = None
+        if self.current and (self.current_tokens + cost > self.token_budget or len(self.current) >= self.max_batch_size):
+            full = self.flush()
+        self.current.append((i, seg))
+        self.current_tokens += cost
+        return full
+
+    def flush(self):
+        """Return the open batch (None if empty) and start a new one."""
+        batch = self.current or None
+        self.current = []
+        self.current_tokens = BATCH_PROMPT_OVERHEAD_TOKENS
+        return batch
+
+
+SUMMARY_PROMPT = (
+    "Given the following interview segments and their sentiment analysis, "
+    "summarize the candidate's strengths, areas for improvement, and provide 2-3 actionable recommendations.\n\n"
+    "Segments and Sentiments:\n"
+)
+MAP_SUMMARY_PROMPT = (
+    "Given the following part of an interview with the sentiment of each segment, "
+    "list the candidate's strengths and areas for improvement shown in this part as short bullet points.\n\n"
+    "Segments and Sentiments:\n"
+)
+REDUCE_SUMMARY_PROMPT = (
+    "Merge the following notes on different parts of the same interview into one list of "
+    "the candidate's strengths and areas for improvement, as short bullet points without repetition.\n\n"
+    "Notes:\n"
+)
+FINAL_SUMMARY_PROMPT = (
+    "Given the following notes on an interview, "
+    "summarize the candidate's strengths, areas for improvement, and provide 2-3 actionable recommendations.\n\n"
+    "Notes:\n"
+)
 
 
 class SentimentAnalysisAgent:
-    def __init__(self, state):
+    def __init__(self, state, early_stop: bool = False):
         self.state = state
+        self.ollama_client = get_ollama_client(state)
+        self.metrics = get_metrics(state)
+        # early_stop: stream responses and cancel generation once the answer is complete
+        self.segment_stop = SEGMENT_STOP if early_stop else None
+        self.batch_stop = BATCH_STOP if early_stop else None
+        # Optional DependencyRecord: results for unchanged segments are reused instead of re-queried
+        self.dependency_record = None
 
-    def run(self, transcript_text: str, segments_path: str = "data/interview_segments.json", output_md_path: str = None):
+    def run(self, transcript_text: str, segments_path: str = "data/interview_segments.json", output_md_path: str = None, max_workers: int = 1, batch_token_budget: int = None, summary_token_budget: int = None):
         """
         Analyze sentiment of each segment using LLM and output results in markdown format, with summary, highlights, and recommendations.
+
+        With max_workers > 1 up to that many segment prompts are in flight at once;
+        results keep their original segment order. With batch_token_budget set, segments
+        are packed into multi-segment prompts of roughly that many tokens each.
+        With summary_token_budget set, the final summary prompt is kept within that
+        many tokens by summarizing in map-reduce rounds.
         """
-        # Load segments
-        with open(segments_path, 'r') as f:
-            segments = json.load(f)
+        if batch_token_budget:
+            # Batching packs segments by size, so it needs them all up front; the table keeps each distinct text once
+            segment_results = self._analyze_segments_batched(
+                segment_table(iter_segments(segments_path)), token_budget=batch_token_budget, max_workers=max_workers
+            )
+        else:
+            # Per-segment prompts read the segments in one pass
+            segment_results = self._analyze_segments(
+                iter_segments(segments_path), max_workers=max_workers, total=count_segments(segments_path)
+            )
+
+        return self.build_report(segment_results, output_md_path, summary_token_budget=summary_token_budget, max_workers=max_workers)
+
+    def build_report(self, segment_results, output_md_path: str = None, summary_token_budget: int = None, max_workers: int = 1):
+        """
+        Build the markdown report (counts, timeline, key moments, LLM summary, per-segment details) from ordered segment results.
 
-        segment_results = []
+        With summary_token_budget set, the strengths/improvements section is produced
+        hierarchically whenever the single prompt would exceed the budget (see _summarize).
+        """
         sentiment_counts = {"Positive": 0, "Neutral": 0, "Negative": 0}
-        for i, seg in enumerate(segments):
-            print(f"Analyzing sentiment for segment {i+1}/{len(segments)}...")
-            prompt = (
-                f"Analyze the sentiment of the following interview segment. "
-                f"Return a one-word sentiment (Positive, Negative, Neutral) and a short explanation.\n\n"
-                f"Segment {i+1}: {seg['text']}"
-            )
-            llm_response = query_ollama(prompt)
-            # Try to extract the one-word sentiment
-            sentiment = "Neutral"
-            explanation = llm_response.strip()
-            for s in ["Positive", "Negative", "Neutral"]:
-                if s.lower() in llm_response.lower():
-                    sentiment = s
-                    break
-            sentiment_counts[sentiment] += 1
-            segment_results.append({
-                "index": i+1,
-                "text": seg['text'],
-                "llm_sentiment": sentiment,
-                "explanation": explanation
-            })
+        for r in segment_results:
+            sentiment_counts[r["llm_sentiment"]] += 1
 
         # Find key positive/negative segments
         key_positive = [r for r in segment_results if r["llm_sentiment"] == "Positive"][:2]
         key_negative = [r for r in segment_results if r["llm_sentiment"] == "Negative"][:2]
 
         # Generate strengths, improvements, and recommendations using LLM
-        summary_prompt = (
-            "Given the following interview segments and their sentiment analysis, "
-            "summarize the candidate's strengths, areas for improvement, and provide 2-3 actionable recommendations.\n\n"
-            "Segments and Sentiments:\n" +
-            "\n".join([f"Segment {r['index']}: {r['text']}\nSentiment: {r['llm_sentiment']}\nExplanation: {r['explanation']}" for r in segment_results])
-        )
-        summary_response = query_ollama(summary_prompt)
+        summary_response = self._summarize(segment_results, token_budget=summary_token_budget, max_workers=max_workers)
 
         # Compose markdown
         md_content = "# Sentiment Analysis Report\n\n"
@@ -98,3 +199,274 @@ class SentimentAnalysisAgent:
                 f.write(md_content)
             self.state.set_state('sentiment_md_file', output_md_path)
         return md_content
+
+    def _analyze_segments(self, segments, max_workers: int = 1, total: int = None):
+        """Run the per-segment sentiment prompts, serially or on a bounded thread pool; segments may be any iterable."""
+        if total is None and isinstance(segments, list):
+            total = len(segments)
+        jobs = ((i, seg, total) for i, seg in enumerate(segments))
+        if max_workers <= 1:
+            return [self.analyze_segment(*job) for job in jobs]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # map() yields results in submission order regardless of completion order
+            return list(executor.map(lambda job: self.analyze_segment(*job), jobs))
+
+    def analyze_segment(self, i, seg, total=None):
+        """
+        Query the LLM for one segment (0-based index i) and return its result entry.
+
+        The prompt holds only the segment text, so a recorded result is reused
+        wherever the segment moves; the model and stop condition are part of the
+        record key.
+        """
+        record = self.dependency_record
+        inputs = [segment_hash(seg)]
+        params = self._record_params("segment", self.segment_stop)
+        if record is not None:
+            recorded = record.lookup("sentiment", inputs, params)
+            if recorded is not None:
+                return {"index": i+1, "text": seg['text'], **recorded}
+
+        of_total = f"/{total}" if total is not None else ""
+        print(f"Analyzing sentiment for segment {i+1}{of_total}...")
+        prompt = (
+            f"Analyze the sentiment of the following interview segment. "
+            f"Return a one-word sentiment (Positive, Negative, Neutral) and a short explanation.\n\n"
+            f"Segment: {seg['text']}"
+        )
+        llm_response = query_ollama(prompt, model=SENTIMENT_MODEL, client=self.ollama_client, metrics=self.metrics, stop=self.segment_stop)
+        # Extract the one-word sentiment
+        sentiment = parse_sentiment_label(llm_response.strip())
+        explanation = llm_response.strip()
+        # A failed query is reported but not recorded, so the next run asks again
+        if record is not None and not is_llm_error(llm_response):
+            record.store("sentiment", inputs, {"llm_sentiment": sentiment, "explanation": explanation}, params)
+        return {
+            "index": i+1,
+            "text": seg['text'],
+            "llm_sentiment": sentiment,
+            "explanation": explanation
+        }
+
+    def _analyze_segments_batched(self, segments, token_budget: int, max_batch_size: int = 32, max_workers: int = 1):
+        """Pack segments into token-budgeted batches and analyze each batch with one prompt."""
+        batches = self._make_batches(enumerate(segments), token_budget, max_batch_size)
+        total = len(segments)
+        print(f"Analyzing sentiment for {total} segments in {len(batches)} batches...")
+
+        if max_workers <= 1:
+            batch_results = [self.analyze_batch(batch, total) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                batch_results = list(executor.map(lambda b: self.analyze_batch(b, total), batches))
+
+        # Batches are in order, so flattening keeps segment order
+        return [r for results in batch_results for r in results]
+
+    def _make_batches(self, indexed_segments, token_budget: int, max_batch_size: int):
+        """Greedily group (index, segment) pairs so each prompt stays within the token budget."""
+        batcher = SegmentBatcher(token_budget, max_batch_size)
+        batches = []
+        for i, seg in indexed_segments:
+            full = batcher.add(i, seg)
+            if full:
+                batches.append(full)
+        last = batcher.flush()
+        if last:
+            batches.append(last)
+        return batches
+
+    def analyze_batch(self, batch, total=None):
+        """
+        Analyze a batch of (0-based index, segment) pairs in one prompt; split it in half and retry if the response does not parse.
+
+        Segments are numbered within the batch, so the prompt depends only on the
+        batch's texts and the batch's results are recorded (and reused) together.
+        """
+        if len(batch) == 1:
+            i, seg = batch[0]
+            return [self.analyze_segment(i, seg, total)]
+
+        record = self.dependency_record
+        inputs = [segment_hash(seg) for _, seg in batch]
+        params = self._record_params("batch", self.batch_stop)
+        if record is not None:
+            recorded = record.lookup("sentiment", inputs, params)
+            if recorded is not None:
+                return [{"index": i+1, "text": seg['text'], **entry} for (i, seg), entry in zip(batch, recorded)]
+
+        first, last = batch[0][0] + 1, batch[-1][0] + 1
+        of_total = f"/{total}" if total is not None else ""
+        print(f"Analyzing sentiment for segments {first}-{last}{of_total}...")
+        results = self._query_batch(batch, total)
+        # A failed query is reported but not recorded, so the next run asks again
+        if record is not None and not any(is_llm_error(r["explanation"]) for r in results):
+            record.store(
+                "sentiment", inputs, [{"llm_sentiment": r["llm_sentiment"], "explanation": r["explanation"]} for r in results], params
+            )
+        return results
+
+    def _query_batch(self, batch, total=None):
+        """Send one batch prompt and parse the per-segment results."""
+        first, last = batch[0][0] + 1, batch[-1][0] + 1
+        segments_text = "\n".join(f"[{n}] {seg['text']}" for n, (_, seg) in enumerate(batch, 1))
+        prompt = (
+            "Analyze the sentiment of each of the following interview segments.\n"
+            "Return ONLY a JSON array with one object per segment, in this exact format:\n"
+            '[{"index": 1, "sentiment": "Positive", "explanation": "short explanation"}]\n'
+            "sentiment must be one of Positive, Negative, Neutral and index must match the segment number.\n\n"
+            f"Segments:\n{segments_text}"
+        )
+        llm_response = query_ollama(prompt, model=SENTIMENT_MODEL, client=self.ollama_client, metrics=self.metrics, stop=self.batch_stop)
+        parsed = self._parse_batch_response(llm_response, range(1, len(batch) + 1))
+
+        if parsed is None:
+            print(f"⚠️  Could not parse batch {first}-{last}, splitting and retrying...")
+            mid = len(batch) // 2
+            return self.analyze_batch(batch[:mid], total) + self.analyze_batch(batch[mid:], total)
+
+        return [
+            {
+                "index": i+1,
+                "text": seg['text'],
+                "llm_sentiment": parsed[n]["sentiment"],
+                "explanation": parsed[n]["explanation"]
+            }
+            for n, (i, seg) in enumerate(batch, 1)
+        ]
+
+    def _record_params(self, prompt: str, stop):
+        """Dependency record parameters of a sentiment result: which prompt, model and stop condition produced it."""
+        return {"prompt": prompt, "model": SENTIMENT_MODEL, "stop": getattr(stop, "key", None)}
+
+    def _parse_batch_response(self, text, expected_indexes):
+        """Parse a batch JSON array into {index: result}, or None if any expected index is missing or invalid."""
+        json_match = re.search(r"\[.*\]", text, re.DOTALL)
+        if not json_match:
+            return None
+        try:
+            items = json.loads(json_match.group())
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(items, list):
+            return None
+
+        labels = {label.lower(): label for label in SENTIMENT_LABELS}
+        results = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            try:
+                index = int(item.get("index"))
+            except (TypeError, ValueError):
+                continue
+            sentiment = labels.get(str(item.get("sentiment", "")).strip().lower())
+            if sentiment is None:
+                continue
+            results[index] = {
+                "sentiment": sentiment,
+                "explanation": str(item.get("explanation", "")).strip(),
+            }
+
+        if any(index not in results for index in expected_indexes):
+            return None
+        return results
+
+    def _summarize(self, segment_results, token_budget: int = None, max_workers: int = 1):
+        """Generate the strengths/improvements/recommendations section, reusing a recorded one for unchanged results."""
+        record = self.dependency_record
+        if record is None:
+            return self._generate_summary(segment_results, token_budget, max_workers)
+
+        inputs = [segment_hash(r, ("text", "llm_sentiment", "explanation")) for r in segment_results]
+        params = {"token_budget": token_budget, "model": SENTIMENT_MODEL}
+        summary = record.lookup("sentiment_summary", inputs, params)
+        if summary is None:
+            summary = self._generate_summary(segment_results, token_budget, max_workers)
+            if not is_llm_error(summary):
+                record.store("sentiment_summary", inputs, summary, params)
+        return summary
+
+    def _generate_summary(self, segment_results, token_budget: int = None, max_workers: int = 1):
+        """
+        Generate the strengths/improvements/recommendations section with the LLM.
+
+        If the single prompt fits token_budget (or no budget is set) it is sent as is.
+        Otherwise windows of segments are summarized in parallel (map), the partial
+        notes are merged in further parallel rounds until they fit in one prompt
+        (reduce), and the final prompt asks for the report section. A single note
+        that is still over the budget is truncated. The number of rounds follows
+        from the budget, so no prompt grows with interview length.
+        """
+        lines = [
+            f"Segment {r['index']}: {r['text']}\nSentiment: {r['llm_sentiment']}\nExplanation: {r['explanation']}"
+            for r in segment_results
+        ]
+        summary_prompt = SUMMARY_PROMPT + "\n".join(lines)
+        if token_budget is None or estimate_tokens(summary_prompt) <= token_budget:
+            return query_ollama(summary_prompt, model=SENTIMENT_MODEL, client=self.ollama_client, metrics=self.metrics)
+
+        groups = self._pack(lines, token_budget - estimate_tokens(MAP_SUMMARY_PROMPT))
+        print(f"Summarizing {len(lines)} segments in {len(groups)} windows...")
+        notes = self._query_all([MAP_SUMMARY_PROMPT + "\n".join(group) for group in groups], max_workers)
+
+        round_number = 1
+        while True:
+            # A failed window would silently drop its segments from the summary
+            failed = next((note for note in notes if is_llm_error(note)), None)
+            if failed is not None:
+                return failed
+            final_prompt = FINAL_SUMMARY_PROMPT + "\n\n".join(notes)
+            if estimate_tokens(final_prompt) <= token_budget:
+                return query_ollama(final_prompt, model=SENTIMENT_MODEL, client=self.ollama_client, metrics=self.metrics)
+            if len(notes) == 1:
+                # A single note cannot be merged any further, so it is cut to fit instead
+                note = self._truncate(notes[0], token_budget - estimate_tokens(FINAL_SUMMARY_PROMPT))
+                return query_ollama(FINAL_SUMMARY_PROMPT + note, model=SENTIMENT_MODEL, client=self.ollama_client, metrics=self.metrics)
+
+            round_number += 1
+            groups = self._pack(notes, token_budget - estimate_tokens(REDUCE_SUMMARY_PROMPT), min_items=2)
+            print(f"Merging {len(notes)} partial summaries into {len(groups)} (round {round_number})...")
+            notes = self._query_all([REDUCE_SUMMARY_PROMPT + "\n\n".join(group) for group in groups], max_workers)
+
+    def _pack(self, items, token_budget: int, min_items: int = 1):
+        """
+        Greedily group consecutive items so each group fits token_budget.
+
+        Items are truncated to token_budget / min_items tokens, so even a group of
+        min_items items fits. min_items=2 guarantees that a reduce round always
+        shrinks the number of items. A budget that leaves less than
+        MIN_PACK_ITEM_TOKENS per item (e.g. when the instructions alone use up the
+        request budget) is raised to that, so items are never cut to nothing.
+        """
+        item_budget = max(token_budget // min_items, MIN_PACK_ITEM_TOKENS)
+        token_budget = item_budget * min_items
+        groups = []
+        current = []
+        current_tokens = 0
+        for item in items:
+            item = self._truncate(item, item_budget)
+            cost = estimate_tokens(item)
+            if len(current) >= min_items and current_tokens + cost > token_budget:
+                groups.append(current)
+                current = []
+                current_tokens = 0
+            current.append(item)
+            current_tokens += cost
+        if current:
+            groups.append(current)
+        return groups
+
+    def _truncate(self, text: str, token_budget: int) -> str:
+        """Cut text to token_budget estimated tokens, but never below MIN_PACK_ITEM_TOKENS."""
+        token_budget = max(token_budget, MIN_PACK_ITEM_TOKENS)
+        # estimate_tokens counts len // 4 + 1, so this many characters is exactly token_budget tokens
+        return text[:(token_budget - 1) * 4]
+
+    def _query_all(self, prompts, max_workers: int = 1):
+        """Send independent prompts, concurrently when max_workers > 1, keeping their order."""
+        if max_workers <= 1:
+            return [query_ollama(prompt, model=SENTIMENT_MODEL, client=self.ollama_client, metrics=self.metrics) for prompt in prompts]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda prompt: query_ollama(prompt, model=SENTIMENT_MODEL, client=self.ollama_client, metrics=self.metrics), prompts))
@@ -1,11 +1,25 @@
 import json
+import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any
-from utils.ollama import query_ollama
+from utils.metrics import get_metrics
+from utils.ollama import query_ollama, get_ollama_client, is_llm_error
+from utils.keyword_index import KeywordIndex
+from utils.dependency_record import segment_hash
+from utils.segment_store import iter_segments
+from utils.segment_table import segment_table
+
+EXPERIENCE_YEARS_PATTERN = re.compile(r"(\d+)\s+years?\s+(?:of\s+)?experience")
+SUPERVISED_PATTERN = re.compile(r"supervised\s+(\w+)\s+(\w+)")
 
 
 class SummarizationAgent:
     def __init__(self, state):
         self.state = state
+        self.ollama_client = get_ollama_client(state)
+        self.metrics = get_metrics(state)
+        # Optional DependencyRecord: summaries whose segments are unchanged are reused instead of re-queried
+        self.dependency_record = None
         self.key_topics = {
             "experience": {
                 "keywords": [
@@ -67,40 +81,57 @@ class SummarizationAgent:
                 "description": "Time management and organizational skills",
             },
         }
+        # Built once; finds all topic keywords in a single pass over the transcript
+        self.keyword_index = KeywordIndex(
+            {topic: config["keywords"] for topic, config in self.key_topics.items()}
+        )
 
-    def analyze_interview(self, segments_json_path: str) -> Dict[str, Any]:
+    def analyze_interview(self, segments_json_path: str, max_workers: int = None) -> Dict[str, Any]:
         """
         Analyze interview segments and generate comprehensive summary.
 
+        The topic summaries and the overall summary are independent LLM calls and run
+        concurrently, so the analysis takes about as long as the slowest of them.
+
         Args:
             segments_json_path: Path to the JSON file containing interview segments
+            max_workers: Maximum concurrent LLM calls (default: all of them at once)
 
         Returns:
             Dictionary containing detailed analysis and summaries
         """
         try:
-            # Load segments data
-            with open(segments_json_path, "r", encoding="utf-8") as f:
-                segments = json.load(f)
-
-            # Separate candidate and interviewer segments
-            candidate_segments = [
-                seg for seg in segments if seg.get("speaker") == "CANDIDATE"
-            ]
-            interviewer_segments = [
-                seg for seg in segments if seg.get("speaker") == "INTERVIEWER"
-            ]
-
-            # Analyze key topics in candidate responses
-            topic_analysis = self._analyze_topics(candidate_segments)
+            # Columnar segments: per-speaker selection and speaking time are array operations
+            table = segment_table(iter_segments(segments_json_path))
+            candidate = table[table.speaker_mask("CANDIDATE")]
+            interviewer = table[table.speaker_mask("INTERVIEWER")]
+            speaking_time = table.speaking_time_by_speaker()
+            candidate_segments = candidate.to_dicts()
+            interviewer_segments = interviewer.to_dicts()
+            # Each distinct text is stored once, so the name search skips repeated segments
+            candidate_name = self._extract_candidate_name(table.texts)
+
+            # Lowercase each candidate segment once for keyword and insight matching
+            candidate_texts = [text.lower() for text in candidate.text_list()]
+
+            with ThreadPoolExecutor(
+                max_workers=max_workers or len(self.key_topics) + 1
+            ) as executor:
+                # Generate overall summary
+                overall_future = executor.submit(
+                    self._generate_overall_summary,
+                    candidate_segments,
+                    interviewer_segments,
+                )
 
-            # Generate overall summary
-            overall_summary = self._generate_overall_summary(
-                candidate_segments, interviewer_segments
-            )
+                # Analyze key topics in candidate responses
+                topic_analysis = self._analyze_topics(
+                    candidate_segments, candidate_texts, executor
+                )
+                overall_summary = overall_future.result()
 
             # Extract key insights
-            key_insights = self._extract_key_insights(candidate_segments)
+            key_insights = self._extract_key_insights(candidate_segments, candidate_texts)
 
             # Generate recommendations
             recommendations = self._generate_recommendations(
@@ -108,17 +139,13 @@ class SummarizationAgent:
             )
 
             summary_report = {
-                "candidate_name": self._extract_candidate_name(segments),
+                "candidate_name": candidate_name,
                 "interview_duration": (
-                    f"{segments[-1]['end']:.1f} seconds" if segments else "Unknown"
-                ),
-                "total_segments": len(segments),
-                "candidate_speaking_time": sum(
-                    seg["end"] - seg["start"] for seg in candidate_segments
-                ),
-                "interviewer_speaking_time": sum(
-                    seg["end"] - seg["start"] for seg in interviewer_segments
+                    f"{table.end[-1]:.1f} seconds" if len(table) else "Unknown"
                 ),
+                "total_segments": len(table),
+                "candidate_speaking_time": speaking_time.get("CANDIDATE", 0.0),
+                "interviewer_speaking_time": speaking_time.get("INTERVIEWER", 0.0),
                 "topic_analysis": topic_analysis,
                 "overall_summary": overall_summary,
                 "key_insights": key_insights,
@@ -133,40 +160,46 @@ class SummarizationAgent:
             print(f"Error during interview analysis: {str(e)}")
             raise e
 
-    def _analyze_topics(self, candidate_segments: List[Dict]) -> Dict[str, Any]:
-        """Analyze candidate responses for key topics."""
+    def _analyze_topics(
+        self,
+        candidate_segments: List[Dict],
+        candidate_texts: List[str] = None,
+        executor: ThreadPoolExecutor = None,
+    ) -> Dict[str, Any]:
+        """Analyze candidate responses for key topics; topic summaries run on executor if given."""
         topic_results = {}
 
-        # Combine all candidate text
-        candidate_text = " ".join([seg["text"] for seg in candidate_segments])
+        if candidate_texts is None:
+            candidate_texts = [seg["text"].lower() for seg in candidate_segments]
+        # Keyword hits and matching segments for every topic, in one pass
+        hits = self.keyword_index.scan(candidate_texts)
 
         for topic, config in self.key_topics.items():
-            # Count keyword mentions
-            keyword_count = sum(
-                1
-                for keyword in config["keywords"]
-                if keyword.lower() in candidate_text.lower()
-            )
+            # Count keyword mentions (distinct keywords found)
+            keyword_count = len(hits[topic]["keywords"])
 
             # Find relevant segments
-            relevant_segments = []
-            for seg in candidate_segments:
-                if any(
-                    keyword.lower() in seg["text"].lower()
-                    for keyword in config["keywords"]
-                ):
-                    relevant_segments.append(
-                        {
-                            "text": seg["text"],
-                            "timestamp": f"{seg['start']:.1f}s - {seg['end']:.1f}s",
-                            "confidence": seg.get("confidence", 0.0),
-                        }
-                    )
+            relevant_segments = [
+                {
+                    "text": candidate_segments[i]["text"],
+                    "timestamp": f"{candidate_segments[i]['start']:.1f}s - {candidate_segments[i]['end']:.1f}s",
+                    "confidence": candidate_segments[i].get("confidence", 0.0),
+                }
+                for i in hits[topic]["segments"]
+            ]
 
             # Generate AI analysis for this topic
-            topic_summary = self._generate_topic_summary(
-                topic, relevant_segments, config["description"]
-            )
+            if executor is not None:
+                topic_summary = executor.submit(
+                    self._generate_topic_summary,
+                    topic,
+                    relevant_segments,
+                    config["description"],
+                )
+            else:
+                topic_summary = self._generate_topic_summary(
+                    topic, relevant_segments, config["description"]
+                )
 
             topic_results[topic] = {
                 "keyword_mentions": keyword_count,
@@ -177,6 +210,11 @@ class SummarizationAgent:
                 ),
             }
 
+        # Wait for the concurrent topic summaries
+        if executor is not None:
+            for result in topic_results.values():
+                result["ai_summary"] = result["ai_summary"].result()
+
         return topic_results
 
     def _generate_topic_summary(
@@ -186,6 +224,21 @@ class SummarizationAgent:
         if not segments:
             return f"No clear evidence of {topic} discussed in the interview."
 
+        record = self.dependency_record
+        if record is not None:
+            inputs = [segment_hash(seg) for seg in segments]
+            params = {"topic": topic, "description": description}
+            summary = record.lookup("topic_summary", inputs, params)
+            if summary is None:
+                summary = self._query_topic_summary(topic, segments, description)
+                if not is_llm_error(summary):
+                    record.store("topic_summary", inputs, summary, params)
+            return summary
+        return self._query_topic_summary(topic, segments, description)
+
+    def _query_topic_summary(
+        self, topic: str, segments: List[Dict], description: str
+    ) -> str:
         segments_text = "\n".join([f"- {seg['text']}" for seg in segments])
 
         prompt = f"""
@@ -196,12 +249,26 @@ Analyze the following interview responses related to {topic} ({description}):
 Provide a concise summary (2-3 sentences) of the candidate's strengths and capabilities in {topic} based on these responses. Focus on specific examples and evidence mentioned.
 """
 
-        return query_ollama(prompt)
+        return query_ollama(prompt, client=self.ollama_client, metrics=self.metrics)
 
     def _generate_overall_summary(
         self, candidate_segments: List[Dict], interviewer_segments: List[Dict]
     ) -> str:
         """Generate overall interview summary using AI."""
+        record = self.dependency_record
+        if record is not None:
+            inputs = [segment_hash(seg, ("speaker", "text")) for seg in candidate_segments + interviewer_segments]
+            summary = record.lookup("overall_summary", inputs)
+            if summary is None:
+                summary = self._query_overall_summary(candidate_segments, interviewer_segments)
+                if not is_llm_error(summary):
+                    record.store("overall_summary", inputs, summary)
+            return summary
+        return self._query_overall_summary(candidate_segments, interviewer_segments)
+
+    def _query_overall_summary(
+        self, candidate_segments: List[Dict], interviewer_segments: List[Dict]
+    ) -> str:
         candidate_text = "\n".join(
             [f"Candidate: {seg['text']}" for seg in candidate_segments]
         )
@@ -225,11 +292,16 @@ Provide a detailed summary (4-5 sentences) covering:
 4. Overall impression of the candidate's suitability
 """
 
-        return query_ollama(prompt)
+        return query_ollama(prompt, client=self.ollama_client, metrics=self.metrics)
 
-    def _extract_key_insights(self, candidate_segments: List[Dict]) -> Dict[str, Any]:
+    def _extract_key_insights(
+        self, candidate_segments: List[Dict], candidate_texts: List[str] = None
+    ) -> Dict[str, Any]:
         """Extract key insights from candidate responses."""
-        all_text = " ".join([seg["text"] for seg in candidate_segments])
+        if candidate_texts is None:
+            candidate_texts = [seg["text"].lower() for seg in candidate_segments]
+        # The _extract_* helpers expect lowercased text
+        all_text = " ".join(candidate_texts)
 
         # Extract specific information
         insights = {
@@ -243,18 +315,15 @@ Provide a detailed summary (4-5 sentences) covering:
         return insights
 
     def _extract_experience_years(self, text: str) -> str:
-        """Extract years of experience from text."""
-        import re
-
-        matches = re.findall(r"(\d+)\s+years?\s+(?:of\s+)?experience", text.lower())
+        """Extract years of experience from lowercased text."""
+        matches = EXPERIENCE_YEARS_PATTERN.findall(text)
         if matches:
             return f"{matches[0]} years"
         return "Not specified"
 
     def _extract_technical_skills(self, text: str) -> List[str]:
-        """Extract technical skills mentioned."""
+        """Extract technical skills mentioned in lowercased text."""
         skills = []
-        text_lower = text.lower()
 
         skill_indicators = [
             ("computer programs", "Computer programs"),
@@ -265,43 +334,39 @@ Provide a detailed summary (4-5 sentences) covering:
         ]
 
         for indicator, skill in skill_indicators:
-            if indicator in text_lower:
+            if indicator in text:
                 skills.append(skill)
 
         return skills
 
     def _extract_management_experience(self, text: str) -> str:
-        """Extract management/supervisory experience."""
-        import re
-
-        text_lower = text.lower()
-
-        if "supervised" in text_lower:
-            matches = re.findall(r"supervised\s+(\w+)\s+(\w+)", text_lower)
+        """Extract management/supervisory experience from lowercased text."""
+        if "supervised" in text:
+            matches = SUPERVISED_PATTERN.findall(text)
             if matches:
                 return f"Supervised {matches[0][0]} {matches[0][1]}"
 
-        if "supervise" in text_lower:
+        if "supervise" in text:
             return "Has supervisory experience"
 
         return "Not mentioned"
 
     def _extract_salary_info(self, text: str) -> str:
-        """Extract salary expectations."""
-        if "going rate" in text.lower():
+        """Extract salary expectations from lowercased text."""
+        if "going rate" in text:
             return "Expects market rate"
         return "Not specified"
 
     def _extract_availability(self, text: str) -> str:
-        """Extract availability information."""
-        if "beginning of next month" in text.lower():
+        """Extract availability information from lowercased text."""
+        if "beginning of next month" in text:
             return "Available beginning of next month"
         return "Not specified"
 
-    def _extract_candidate_name(self, segments: List[Dict]) -> str:
-        """Extract candidate name from segments."""
-        for seg in segments:
-            if "stevens" in seg["text"].lower():
+    def _extract_candidate_name(self, texts: List[str]) -> str:
+        """Extract candidate name from segment texts."""
+        for text in texts:
+            if "stevens" in text.lower():
                 return "Mrs. Stevens"
         return "Unknown"
 
@@ -448,12 +513,21 @@ Provide a detailed summary (4-5 sentences) covering:
             print(f"Error generating human-readable report: {str(e)}")
             raise e
 
-    def run(self, segments_json_path: str) -> Dict[str, Any]:
+    def run(
+        self,
+        segments_json_path: str,
+        max_workers: int = None,
+        json_path: str = None,
+        text_path: str = None,
+    ) -> Dict[str, Any]:
         """
         Main method to run the complete summarization analysis.
 
         Args:
             segments_json_path: Path to the interview segments JSON file
+            max_workers: Maximum concurrent LLM calls (default: all of them at once)
+            json_path: Optional path for the JSON report
+            text_path: Optional path for the human-readable report
 
         Returns:
             Complete summary report dictionary
@@ -461,16 +535,21 @@ Provide a detailed summary (4-5 sentences) covering:
         print("📊 Analyzing interview content...")
 
         # Generate analysis
-        summary_report = self.analyze_interview(segments_json_path)
+        summary_report = self.analyze_interview(segments_json_path, max_workers)
+
+        self.save(summary_report, json_path, text_path)
+
+        print("✅ Interview analysis completed!")
+        return summary_report
 
-        # Save reports
-        json_path = self.save_summary_report(summary_report)
-        text_path = self.generate_human_readable_report(summary_report)
+    def save(
+        self, summary_report: Dict[str, Any], json_path: str = None, text_path: str = None
+    ):
+        """Write the JSON and human-readable reports and record them in state."""
+        json_path = self.save_summary_report(summary_report, json_path)
+        text_path = self.generate_human_readable_report(summary_report, text_path)
 
         # Update state
         self.state.set_state("summary_report", summary_report)
         self.state.set_state("summary_json_file", json_path)
         self.state.set_state("summary_text_file", text_path)
-
-        print("✅ Interview analysis completed!")
-        return summary_report
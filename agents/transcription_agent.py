@@ -1,37 +1,88 @@
-from utils.audio_utils import transcribe_audio, save_transcript, save_segments_json
+import time
+from utils.audio_utils import save_transcript, save_segments_json, stream_transcribe_audio, transcript_from_segments
+from utils.segment_store import segments_jsonl_path, stream_segments_jsonl
+from utils.metrics import get_metrics
 from agents.diarization_agent import DiarizationAgent
 
 
 class TranscriptionAgent:
-    def __init__(self, state):
+    def __init__(self, state, early_stop: bool = False):
         self.state = state
-        self.diarization_agent = DiarizationAgent(state)
+        self.diarization_agent = DiarizationAgent(state, early_stop=early_stop)
+        self.metrics = get_metrics(state)
 
     def run(self, audio_path: str):
-        print("📝 Transcribing audio...")
-        transcript_data = transcribe_audio(audio_path)
+        transcript_data = self.transcribe(audio_path)
 
         # Step 2: Perform speaker diarization
-        print("🎭 Performing speaker diarization...")
-        enriched_segments = self.diarization_agent.analyze_speakers(
-            transcript_data["segments"]
+        transcript_data = self.diarize(transcript_data)
+
+        self.save(transcript_data)
+
+        print("✅ Transcription and diarization completed.")
+        return transcript_data
+
+    def transcribe(self, audio_path: str, model_size: str = "base"):
+        print("📝 Transcribing audio...")
+        info = {}
+        started = time.perf_counter()
+        segments = list(self.stream(audio_path, model_size=model_size, info=info))
+        # Whisper real-time factor: processing time relative to the audio duration
+        if info.get("audio_duration"):
+            self.metrics.record_transcription(info["audio_duration"], time.perf_counter() - started, model_size)
+        transcript_data = transcript_from_segments(segments, info)
+        print(f"Transcription completed. Detected language: {transcript_data['language']}")
+        print(f"Number of segments: {len(segments)}")
+        return transcript_data
+
+    def stream(self, audio_path: str, model_size: str = "base", info=None):
+        """
+        Yield segments as Whisper decodes them, appending each to the JSON Lines segment file.
+
+        The file can be followed while transcription runs; save() rewrites it with
+        the speaker labels. info is filled as by stream_transcribe_audio.
+        """
+        # Use audio decoded in memory by the extraction agent when available
+        segments = stream_transcribe_audio(
+            audio_path, model_size=model_size, audio=self.state.get_state("audio_array"), info=info
         )
+        return stream_segments_jsonl(segments, segments_jsonl_path(audio_path))
+
+    def diarize(self, transcript_data, backend: str = "llm", **options):
+        print("🎭 Performing speaker diarization...")
+        if backend == "acoustic":
+            # Cluster voices from the audio; only the cluster-to-role mapping uses the LLM
+            enriched_segments = self.diarization_agent.analyze_speakers_acoustic(
+                transcript_data["segments"],
+                audio_path=transcript_data["audio_path"],
+                audio=self.state.get_state("audio_array"),
+            )
+        else:
+            # options are passed to DiarizationAgent.analyze_speakers (chunk_size, context_overlap, max_workers)
+            enriched_segments = self.diarization_agent.analyze_speakers(
+                transcript_data["segments"], **options
+            )
 
         # Update transcript data with speaker information
-        transcript_data["segments"] = enriched_segments
+        return {**transcript_data, "segments": enriched_segments}
 
+    def save(self, transcript_data):
         # Save to state manager
         self.state.set_state("transcript_data", transcript_data)
         self.state.set_state("transcript_text", transcript_data["text"])
-        self.state.set_state("segments", enriched_segments)
+        self.state.set_state("segments", transcript_data["segments"])
 
         # Save transcript to file
         transcript_file_path = save_transcript(transcript_data)
         self.state.set_state("transcript_file", transcript_file_path)
 
-        # Save segments in JSON format (now with speaker info)
-        json_file_path = save_segments_json(transcript_data)
+        # Save segments in JSON format (now with speaker info), streaming each one to the
+        # JSON Lines file the later stages read as it is written, so both take one pass.
+        # This replaces the speakerless JSON Lines file written during transcription
+        jsonl_file_path = segments_jsonl_path(transcript_data["audio_path"])
+        json_file_path = save_segments_json({
+            **transcript_data,
+            "segments": stream_segments_jsonl(transcript_data["segments"], jsonl_file_path, flush_each=False),
+        })
         self.state.set_state("segments_json_file", json_file_path)
-
-        print("✅ Transcription and diarization completed.")
-        return transcript_data
+        self.state.set_state("segments_jsonl_file", jsonl_file_path)
@@ -0,0 +1,191 @@
+import json
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+SENTIMENTS = ["Positive", "Neutral", "Negative"]
+
+DIARIZATION_SEGMENT = re.compile(r'^Segment (\d+): \[[^\]]*\] "(.*)"$', re.MULTILINE)
+BATCH_SEGMENT = re.compile(r"^\[(\d+)\] (.*)$", re.MULTILINE)
+VOICE_CLUSTER = re.compile(r"^SPEAKER_(\d+):\n((?:- .*\n?)*)", re.MULTILINE)
+
+
+def _pick(text: str, options):
+    """Deterministic choice, so repeated runs get identical responses."""
+    return options[zlib.crc32(text.encode("utf-8")) % len(options)]
+
+
+def canned_response(prompt: str) -> str:
+    """
+    A plausible, well-formed response for each prompt the pipeline sends.
+
+    Questions are attributed to the interviewer, everything else to the candidate.
+    """
+    if "SEGMENTS TO ANALYZE" in prompt:
+        analysis = [
+            {
+                "segment_index": int(index),
+                "speaker": "INTERVIEWER" if text.endswith("?") else "CANDIDATE",
+                "confidence": 0.9,
+                "reasoning": "Asks a question" if text.endswith("?") else "Answers the question",
+            }
+            for index, text in DIARIZATION_SEGMENT.findall(prompt)
+        ]
+        return json.dumps({"speaker_analysis": analysis, "summary": {}}, indent=2)
+
+    if "split into speakers by voice" in prompt:
+        clusters = VOICE_CLUSTER.findall(prompt)
+        interviewer = max(clusters, key=lambda c: c[1].count("?"))[0] if clusters else "0"
+        return json.dumps({
+            f"SPEAKER_{label}": "INTERVIEWER" if label == interviewer else "CANDIDATE"
+            for label, _ in clusters
+        })
+
+    if "Return ONLY a JSON array" in prompt:
+        return json.dumps([
+            {"index": int(index), "sentiment": _pick(text, SENTIMENTS), "explanation": "The tone of the answer is clear."}
+            for index, text in BATCH_SEGMENT.findall(prompt.split("Segments:\n", 1)[-1])
+        ])
+
+    if prompt.startswith("Analyze the sentiment of the following interview segment"):
+        sentiment = _pick(prompt, SENTIMENTS)
+        return (
+            f"{sentiment}\n\nThe speaker's wording comes across as {sentiment.lower()}. "
+            "They answer directly and stay on topic, which suggests they are comfortable with the question. "
+            "There is nothing in the segment that points the other way."
+        )
+
+    return (
+        "The candidate describes relevant experience and gives concrete examples. "
+        "They communicate clearly and show good organization and teamwork. "
+        "Areas for improvement include giving more detail on problem solving. "
+        "Recommendations: ask for specific metrics, probe leadership examples, and check references."
+    )
+
+
+class FakeOllamaServer:
+    """
+    Local stand-in for the Ollama /api/generate endpoint.
+
+    Supports streaming and non-streaming requests and reports the same token
+    counters as Ollama. Each request waits `latency` seconds (time to first token),
+    then generates at `tokens_per_second` (one whitespace-separated word per token).
+    A streamed request stops generating when the client disconnects, like Ollama.
+
+    Use as a context manager; `url` is the host to pass to OllamaClient.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        tokens_per_second: Optional[float] = None,
+        responder: Callable[[str], str] = canned_response,
+        port: int = 0,
+    ):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.responder = responder
+        self.requests = 0
+        self.cancelled = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, attribute: str):
+        with self._lock:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; with Nagle each response would stall on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                if self.path != "/api/generate":
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server._count("requests")
+                prompt = body.get("prompt", "")
+                tokens = re.findall(r"\S+\s*", server.responder(prompt))
+                stats = {"prompt_eval_count": len(prompt) // 4 + 1, "eval_count": len(tokens)}
+                started = time.perf_counter()
+                time.sleep(server.latency)
+
+                if not body.get("stream", True):
+                    if server.tokens_per_second:
+                        time.sleep(len(tokens) / server.tokens_per_second)
+                    self._send_json({
+                        "model": body.get("model"),
+                        "response": "".join(tokens),
+                        "done": True,
+                        **stats,
+                        "eval_duration": int((time.perf_counter() - started) * 1e9),
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for token in tokens:
+                        if server.tokens_per_second:
+                            time.sleep(1 / server.tokens_per_second)
+                        self._send_chunk({"model": body.get("model"), "response": token, "done": False})
+                    self._send_chunk({
+                        "model": body.get("model"),
+                        "response": "",
+                        "done": True,
+                        **stats,
+                        "eval_duration": int((time.perf_counter() - started) * 1e9),
+                    })
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    server._count("cancelled")
+                    self.close_connection = True
+
+            def _send_json(self, data):
+                payload = json.dumps(data).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _send_chunk(self, data):
+                line = (json.dumps(data) + "\n").encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+
+        return Handler
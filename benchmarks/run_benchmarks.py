@@ -0,0 +1,248 @@
+"""
+Offline benchmark scenarios for the agents and the full pipeline.
+
+LLM calls go to a local FakeOllamaServer with configurable latency, and the
+interviews are synthetic, so runs are reproducible and need neither Ollama nor
+real recordings. Results are written to benchmarks/results/<commit>.json;
+pass --compare with an earlier results file to see the change per scenario.
+
+    python -m benchmarks.run_benchmarks --sizes 10 100 1000
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/abc1234.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+# Every request must reach the fake server; set before any agent is used
+os.environ["LLM_CACHE_DISABLED"] = "1"
+
+from benchmarks.fake_ollama import FakeOllamaServer
+from benchmarks.synthetic import (
+    label_speakers,
+    make_audio,
+    make_segments,
+    make_transcript,
+    write_segments_json,
+    write_wav,
+)
+from core.state_mangement import StateManager
+from utils.metrics import get_metrics
+from utils.ollama import OllamaClient
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def bench_diarization(workdir, segments, options):
+    from agents.diarization_agent import DiarizationAgent
+
+    agent = DiarizationAgent(options["state"])
+    agent.analyze_speakers(segments, max_workers=options["llm_workers"])
+
+
+def bench_acoustic_diarization(workdir, segments, options):
+    from agents.diarization_agent import DiarizationAgent
+
+    agent = DiarizationAgent(options["state"])
+    agent.analyze_speakers_acoustic(segments, audio_path=None, audio=make_audio(segments))
+
+
+def bench_sentiment(workdir, segments, options):
+    from agents.sentiment_analysis_agent import SentimentAnalysisAgent
+
+    segments_path = write_segments_json(label_speakers(segments), os.path.join(workdir, "segments.json"))
+    agent = SentimentAnalysisAgent(options["state"])
+    agent.run(
+        transcript_text=" ".join(seg["text"] for seg in segments),
+        segments_path=segments_path,
+        output_md_path=os.path.join(workdir, "sentiment.md"),
+        max_workers=options["llm_workers"],
+    )
+
+
+def bench_summarization(workdir, segments, options):
+    from agents.summarization_agent import SummarizationAgent
+
+    segments_path = write_segments_json(label_speakers(segments), os.path.join(workdir, "segments.json"))
+    SummarizationAgent(options["state"]).analyze_interview(segments_path)
+
+
+def _orchestrator_run(workdir, segments, options, **orchestrator_kwargs):
+    """Full OrchestratorAgent.run with the transcription stage already in the artifact cache."""
+    from agents.orchestrator_agent import OrchestratorAgent
+
+    media_path = write_wav(make_audio(segments), os.path.join(workdir, "interview.wav"))
+    orchestrator = OrchestratorAgent(
+        options["state"],
+        cache_dir=os.path.join(workdir, "cache"),
+        llm_workers=options["llm_workers"],
+        **orchestrator_kwargs,
+    )
+    # Seeding the transcription artifact skips ffmpeg and Whisper; see the "transcription" scenario for those
+    keys = orchestrator.stage_keys(media_path)
+    orchestrator.artifact_cache.save("transcription", keys["transcription"], make_transcript(segments, media_path))
+    orchestrator.run(media_path)
+
+
+def bench_orchestrator(workdir, segments, options):
+    _orchestrator_run(workdir, segments, options)
+
+
+def bench_orchestrator_overlapped(workdir, segments, options):
+    _orchestrator_run(workdir, segments, options, overlap_llm=True)
+
+
+def bench_transcription(workdir, segments, options):
+    """ffmpeg extraction and Whisper transcription of synthetic audio as long as the interview."""
+    from agents.orchestrator_agent import OrchestratorAgent
+
+    # A WAV input is extracted to interview_audio.wav next to it, never onto itself
+    media_path = write_wav(make_audio(segments), os.path.join(workdir, "interview.wav"))
+    orchestrator = OrchestratorAgent(options["state"], use_cache=False)
+    orchestrator.model_size = options["whisper_model"]
+    extraction = orchestrator.extraction_stage(media_path, {})
+    orchestrator.transcription_stage(media_path, {}, extraction)
+
+
+SCENARIOS: Dict[str, Callable] = {
+    "diarization": bench_diarization,
+    "acoustic_diarization": bench_acoustic_diarization,
+    "sentiment": bench_sentiment,
+    "summarization": bench_summarization,
+    "orchestrator": bench_orchestrator,
+    "orchestrator_overlapped": bench_orchestrator_overlapped,
+    "transcription": bench_transcription,
+}
+DEFAULT_SCENARIOS = [name for name in SCENARIOS if name != "transcription"]
+
+
+def run_scenario(name: str, size: int, server: FakeOllamaServer, args) -> Dict[str, Any]:
+    """Run one scenario in a scratch directory and return its measurements."""
+    segments = make_segments(size, seed=args.seed)
+    state = StateManager()
+    state.set_state("ollama_client", OllamaClient(host=server.url, pool_size=max(8, args.llm_workers)))
+    metrics = get_metrics(state)
+    options = {"state": state, "llm_workers": args.llm_workers, "whisper_model": args.whisper_model}
+
+    workdir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    # Scenarios run inside their scratch directory so no output can land in the repository
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    requests_before = server.requests
+    output = io.StringIO()
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    try:
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else output):
+            SCENARIOS[name](workdir, segments, options)
+        status, error = "ok", None
+    except Exception as e:
+        status, error = "failed", f"{type(e).__name__}: {e}"
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = metrics.summary()
+    llm = summary["llm"].get("llama3.2", {})
+    return {
+        "scenario": name,
+        "segments": size,
+        "status": status,
+        "error": error,
+        "wall_seconds": time.perf_counter() - started,
+        "cpu_seconds": time.process_time() - cpu_started,
+        "llm_requests": server.requests - requests_before,
+        "llm_latency_p50": llm.get("latency_seconds", {}).get("p50"),
+        "llm_latency_p95": llm.get("latency_seconds", {}).get("p95"),
+        "llm_latency_p99": llm.get("latency_seconds", {}).get("p99"),
+        "metrics": summary,
+    }
+
+
+def git_revision() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True
+        ).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]):
+    """Print wall time per scenario and size against a baseline results file."""
+    before = {(r["scenario"], r["segments"]): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    print(f"{'scenario':<26}{'segments':>9}{'before s':>11}{'after s':>11}{'change':>9}")
+    for r in current["results"]:
+        old = before.get((r["scenario"], r["segments"]))
+        if old is None or old["status"] != "ok" or r["status"] != "ok":
+            continue
+        change = (r["wall_seconds"] - old["wall_seconds"]) / old["wall_seconds"] * 100 if old["wall_seconds"] else 0.0
+        print(f"{r['scenario']:<26}{r['segments']:>9}{old['wall_seconds']:>11.3f}{r['wall_seconds']:>11.3f}{change:>+8.1f}%")
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Run the offline benchmark scenarios.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="Interview sizes in segments")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=DEFAULT_SCENARIOS,
+                        help="Scenarios to run (transcription needs ffmpeg and Whisper and is off by default)")
+    parser.add_argument("--latency", type=float, default=0.01, help="Fake LLM time to first token, in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="Fake LLM generation speed (default: instant)")
+    parser.add_argument("--llm-workers", type=int, default=4, help="Concurrent LLM requests where agents support it")
+    parser.add_argument("--whisper-model", default="tiny", help="Whisper model for the transcription scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Show the agents' own output")
+    args = parser.parse_args(argv)
+
+    revision = git_revision()
+    report = {
+        **revision,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "verbose")},
+        "results": [],
+    }
+
+    with FakeOllamaServer(latency=args.latency, tokens_per_second=args.tokens_per_second) as server:
+        for name in args.scenarios:
+            for size in args.sizes:
+                result = run_scenario(name, size, server, args)
+                report["results"].append(result)
+                if result["status"] == "ok":
+                    print(f"{name:<26}{size:>6} segments {result['wall_seconds']:>9.3f}s  {result['llm_requests']:>5} LLM requests")
+                else:
+                    print(f"{name:<26}{size:>6} segments  failed: {result['error']}")
+
+    output_path = args.output
+    if output_path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        name = revision["commit"] or time.strftime("%Y%m%d-%H%M%S")
+        output_path = os.path.join(RESULTS_DIR, f"{name}{'-dirty' if revision['dirty'] else ''}.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    print(f"Benchmark results saved to: {output_path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+    return all(r["status"] == "ok" for r in report["results"])
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
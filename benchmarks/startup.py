@@ -0,0 +1,128 @@
+"""
+Startup-time benchmark for the CLI.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter, reports the
+total import time and the heaviest modules, and checks that the heavy
+dependencies (Whisper, torch, LangChain, numpy) are not loaded just by importing
+main. Also times `python main.py --help` end to end. Results are written to
+benchmarks/results/startup-<commit>.json.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --max-ms 300
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from benchmarks.run_benchmarks import RESULTS_DIR, git_revision
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["whisper", "torch", "langchain", "langchain_core", "numpy"]
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """
+    Parse -X importtime output into {"module", "self_us", "cumulative_us"} entries.
+
+    Lines look like `import time:       412 |        920 | encodings`, with the
+    module name indented by nesting depth.
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # column header
+        entries.append({
+            "module": parts[2].strip(),
+            "self_us": int(parts[0]),
+            "cumulative_us": int(parts[1]),
+            "top_level": not parts[2][1:].startswith(" "),
+        })
+    return entries
+
+
+def measure_import(module: str = "main") -> Dict:
+    """Import `module` in a fresh interpreter and summarize where the time went."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    entries = parse_importtime(result.stderr)
+    loaded = {entry["module"] for entry in entries}
+    total_us = sum(entry["cumulative_us"] for entry in entries if entry["top_level"])
+    return {
+        "module": module,
+        "total_ms": total_us / 1000,
+        "modules_loaded": len(entries),
+        "heaviest": [
+            {"module": e["module"], "cumulative_ms": e["cumulative_us"] / 1000}
+            for e in sorted(entries, key=lambda e: e["cumulative_us"], reverse=True)[:15]
+        ],
+        "heavy_modules_loaded": [name for name in HEAVY_MODULES if name in loaded],
+    }
+
+
+def measure_help(runs: int = 5) -> Dict:
+    """Wall time of `python main.py --help`, best and median of several runs."""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "main.py", "--help"], cwd=REPO_ROOT, capture_output=True, check=True)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {"runs": runs, "best_ms": timings[0], "median_ms": timings[len(timings) // 2]}
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Measure CLI startup time.")
+    parser.add_argument("--runs", type=int, default=5, help="Runs of `main.py --help` to time")
+    parser.add_argument("--max-ms", type=float, default=None, help="Fail if importing main takes longer than this")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/startup-<commit>.json)")
+    args = parser.parse_args(argv)
+
+    revision = git_revision()
+    imports = measure_import("main")
+    help_timing = measure_help(args.runs)
+    report = {
+        **revision,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "import_main": imports,
+        "help": help_timing,
+    }
+
+    print(f"import main: {imports['total_ms']:.1f} ms ({imports['modules_loaded']} modules)")
+    for entry in imports["heaviest"][:10]:
+        print(f"  {entry['cumulative_ms']:>8.1f} ms  {entry['module']}")
+    print(f"main.py --help: best {help_timing['best_ms']:.1f} ms, median {help_timing['median_ms']:.1f} ms")
+
+    ok = True
+    if imports["heavy_modules_loaded"]:
+        print(f"❌ Heavy modules imported at startup: {', '.join(imports['heavy_modules_loaded'])}")
+        ok = False
+    if args.max_ms is not None and imports["total_ms"] > args.max_ms:
+        print(f"❌ import main took {imports['total_ms']:.1f} ms (limit {args.max_ms:.0f} ms)")
+        ok = False
+
+    output_path = args.output
+    if output_path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        name = revision["commit"] or time.strftime("%Y%m%d-%H%M%S")
+        output_path = os.path.join(RESULTS_DIR, f"startup-{name}{'-dirty' if revision['dirty'] else ''}.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    print(f"Startup results saved to: {output_path}")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,115 @@
+import json
+import random
+import wave
+from typing import Dict, List
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+QUESTIONS = [
+    "Can you tell me about your experience in this position?",
+    "How do you work with a team when there is a difficult deadline?",
+    "What would you do if a customer had a problem you could not solve?",
+    "How do you organize your schedule when everything is a priority?",
+    "Why are you interested in this role?",
+    "What are your salary expectations?",
+    "When would you be available to start?",
+]
+
+ANSWERS = [
+    "I have 5 years of experience as an office manager and I supervised three assistants.",
+    "I like to collaborate with colleagues and keep the whole group informed about the schedule.",
+    "I usually approach a difficult issue step by step until I find a solution that works.",
+    "I am very organized, I can type 100 words per minute and I am a fast learner.",
+    "In my previous job I handled the computer programs for billing and payroll.",
+    "I think the going rate for this kind of position would be fair.",
+    "I could start at the beginning of next month.",
+    "Honestly that was a challenge, but we managed to overcome it as a team.",
+]
+
+
+def make_segments(count: int, seed: int = 0, min_seconds: float = 2.0, max_seconds: float = 8.0) -> List[Dict]:
+    """
+    Synthetic interview segments in the pipeline's {start, end, text} format.
+
+    Turns alternate between interviewer questions and (one or two) candidate answers,
+    drawn from fixed phrase lists so topic keywords, insights and sentiment all have
+    something to find. The same seed always gives the same interview.
+    """
+    rng = random.Random(seed)
+    segments = []
+    time = 0.0
+    answers_left = 0
+    for i in range(count):
+        if answers_left == 0:
+            text = rng.choice(QUESTIONS)
+            answers_left = rng.randint(1, 2)
+        else:
+            text = rng.choice(ANSWERS)
+            answers_left -= 1
+        duration = rng.uniform(min_seconds, max_seconds)
+        segments.append({"start": round(time, 2), "end": round(time + duration, 2), "text": text})
+        time += duration + rng.uniform(0.1, 0.6)
+    return segments
+
+
+def label_speakers(segments: List[Dict]) -> List[Dict]:
+    """Add the speaker/confidence fields diarization would produce (questions are the interviewer's)."""
+    return [
+        {
+            **seg,
+            "speaker": "INTERVIEWER" if seg["text"].endswith("?") else "CANDIDATE",
+            "confidence": 0.9,
+        }
+        for seg in segments
+    ]
+
+
+def make_transcript(segments: List[Dict], audio_path: str) -> Dict:
+    """Transcript data as returned by transcribe_audio."""
+    return {
+        "text": " ".join(seg["text"] for seg in segments),
+        "language": "en",
+        "segments": segments,
+        "audio_path": audio_path,
+    }
+
+
+def write_segments_json(segments: List[Dict], output_path: str) -> str:
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(segments, f, indent=4, ensure_ascii=False)
+    return output_path
+
+
+def make_audio(segments: List[Dict], seed: int = 0) -> np.ndarray:
+    """
+    16 kHz mono float32 audio following the segments' timing.
+
+    Each speaker is a different harmonic tone (with vibrato and background noise),
+    so the acoustic diarization backend can tell them apart; gaps are low noise.
+    There is no speech, so Whisper output is not meaningful, only its run time.
+    """
+    rng = np.random.default_rng(seed)
+    total = int((segments[-1]["end"] + 0.5) * SAMPLE_RATE) if segments else SAMPLE_RATE
+    audio = rng.normal(0.0, 0.003, total).astype(np.float32)
+    for seg in segments:
+        start = int(seg["start"] * SAMPLE_RATE)
+        end = min(int(seg["end"] * SAMPLE_RATE), total)
+        t = np.arange(end - start, dtype=np.float32) / SAMPLE_RATE
+        pitch = 120.0 if seg["text"].endswith("?") else 210.0
+        phase = 2 * np.pi * pitch * t + 3.0 * np.sin(2 * np.pi * 5.0 * t)
+        voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+        audio[start:end] += (0.1 * voice + rng.normal(0.0, 0.01, end - start)).astype(np.float32)
+    return np.clip(audio, -1.0, 1.0)
+
+
+def write_wav(audio: np.ndarray, output_path: str) -> str:
+    """Write float32 samples as 16-bit PCM WAV, the format the extraction agent produces."""
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+    with wave.open(output_path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(pcm.tobytes())
+    return output_path
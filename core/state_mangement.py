@@ -1,8 +1,39 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from types import MappingProxyType
+
+
 class StateManager:
-    """A simple state management class for agents."""
+    """
+    Thread-safe state shared by the agents, optionally persisted to SQLite.
+
+    Writes never mutate the current dict; they swap in an updated copy under a
+    lock (copy-on-write). snapshot() is therefore O(1) and a snapshot never
+    changes after it is taken, and update_state() applies several keys at once.
+    Values themselves are shared, not copied, so treat them as read-only.
 
-    def __init__(self):
+    With a path, every write is also committed to SQLite in the same step, so a
+    crashed run can be restored from its last write by opening the same path and
+    run_id again. Several processes may share a file, but each StateManager
+    reads it only when created and on reload(), so it does not see the others'
+    writes in between. update_state_with() reloads inside the write transaction,
+    so its read-modify-write is atomic across processes too. Values that are not
+    JSON-serializable (clients, metric collectors, audio arrays) are kept in
+    memory only.
+    """
+
+    def __init__(self, path: str = None, run_id: str = "default", restore: bool = True):
         self.state = {}
+        self.path = path
+        self.run_id = run_id
+        self._lock = threading.RLock()
+        self._conn = None
+        self._conn_pid = None
+        if path and restore:
+            self.reload()
 
     """Get the value associated with a key in the state."""
 
@@ -12,30 +43,137 @@ class StateManager:
     """Set the value associated with a key in the state."""
 
     def set_state(self, key, value):
-        self.state[key] = value
+        self.update_state({key: value})
 
     """Clear the state."""
 
     def clear_state(self):
-        self.state.clear()
+        with self._lock:
+            self.state = {}
+            if self.path:
+                with self._transaction() as conn:
+                    conn.execute("DELETE FROM state WHERE run_id = ?", (self.run_id,))
 
-    """Get the entire state dictionary."""
+    """Get a copy of the entire state dictionary."""
 
     def get_all_state(self):
-        return self.state
+        return dict(self.state)
 
-    """Update multiple key-value pairs in the state."""
+    """Update multiple key-value pairs in the state atomically."""
 
     def update_state(self, updates):
-        if isinstance(updates, dict):
-            self.state.update(updates)
-        else:
+        if not isinstance(updates, dict):
             raise ValueError("Updates must be provided as a dictionary.")
 
+        with self._lock:
+            if self.path:
+                self._persist(updates)
+            self.state = {**self.state, **updates}
+
+    """Atomically apply the updates returned by fn(snapshot), e.g. to extend a value read from the state."""
+
+    def update_state_with(self, fn):
+        with self._lock:
+            if not self.path:
+                updates = fn(self.snapshot())
+                self.update_state(updates)
+                return updates
+
+            # Take SQLite's write lock before reading, so no other process can write in between
+            with self._transaction() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                self._load(conn)
+                updates = fn(self.snapshot())
+                self._write(conn, updates)
+            self.state = {**self.state, **updates}
+            return updates
+
     """Remove a key from the state."""
 
     def remove_state(self, key):
-        if key in self.state:
-            del self.state[key]
-        else:
-            raise KeyError(f"Key '{key}' not found in state.")
+        with self._lock:
+            if key not in self.state:
+                raise KeyError(f"Key '{key}' not found in state.")
+            if self.path:
+                with self._transaction() as conn:
+                    conn.execute("DELETE FROM state WHERE run_id = ? AND key = ?", (self.run_id, key))
+            self.state = {k: v for k, v in self.state.items() if k != key}
+
+    """Get a read-only view of the state as it is now; later writes do not change it."""
+
+    def snapshot(self):
+        return MappingProxyType(self.state)
+
+    """Replace the state with an earlier snapshot."""
+
+    def restore_snapshot(self, snapshot):
+        with self._lock:
+            if self.path:
+                self._persist(dict(snapshot), replace=True)
+            self.state = dict(snapshot)
+
+    """Load the persisted state for this run_id, keeping in-memory-only values."""
+
+    def reload(self):
+        with self._lock:
+            return self._load(self._connection())
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _load(self, conn):
+        rows = conn.execute("SELECT key, value FROM state WHERE run_id = ?", (self.run_id,)).fetchall()
+        self.state = {**self.state, **{key: json.loads(value) for key, value in rows}}
+        return len(rows)
+
+    def _persist(self, updates, replace=False):
+        with self._transaction() as conn:
+            self._write(conn, updates, replace)
+
+    def _write(self, conn, updates, replace=False):
+        rows = []
+        memory_only = []
+        for key, value in updates.items():
+            try:
+                rows.append((self.run_id, key, json.dumps(value, ensure_ascii=False), time.time()))
+            except (TypeError, ValueError):
+                memory_only.append((self.run_id, key))
+
+        if replace:
+            conn.execute("DELETE FROM state WHERE run_id = ?", (self.run_id,))
+        conn.executemany(
+            "INSERT OR REPLACE INTO state (run_id, key, value, updated_at) VALUES (?, ?, ?, ?)", rows
+        )
+        # A stale persisted value must not come back on restore
+        conn.executemany("DELETE FROM state WHERE run_id = ? AND key = ?", memory_only)
+
+    def _transaction(self):
+        # The connection context manager commits on success and rolls back on error
+        return self._connection()
+
+    def _connection(self):
+        # Connections must not cross a fork, so a child process opens its own
+        if self._conn is None or self._conn_pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS state (
+                    run_id TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (run_id, key)
+                )
+                """
+            )
+            conn.commit()
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
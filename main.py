@@ -1,13 +1,113 @@
-from core.state_mangement import StateManager
-from agents.orchestrator_agent import OrchestratorAgent
+import argparse
 import os
+import sys
+
+from utils.media import MEDIA_EXTENSIONS
+
+# The agents pull in Whisper, LangChain and the HTTP stack; they are imported only
+# after the arguments are parsed so `--help` and usage errors return immediately
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Analyze interview recordings: transcription, speaker diarization, sentiment and summary reports."
+    )
+    parser.add_argument(
+        "input",
+        nargs="?",
+        default=os.path.join("data", "interview.mp4"),
+        help="A recording, or a directory / manifest of recordings for batch mode (default: data/interview.mp4)",
+    )
+
+    pipeline = parser.add_argument_group("pipeline")
+    pipeline.add_argument("--in-memory-audio", action="store_true", help="Decode audio straight to memory for Whisper")
+    pipeline.add_argument("--no-wav", action="store_true", help="With --in-memory-audio, do not write the WAV file")
+    pipeline.add_argument("--no-cache", action="store_true", help="Recompute every stage instead of reusing cached stage artifacts (LLM responses are still cached)")
+    pipeline.add_argument("--no-llm-cache", action="store_true", help="Send every LLM request instead of reusing cached responses")
+    pipeline.add_argument("--cache-dir", default=None, help="Stage artifact cache directory")
+    pipeline.add_argument(
+        "--state-file",
+        default=None,
+        help="Persist pipeline state to this SQLite file so a crashed run can resume; "
+        "finished stages are restored from the stage cache, so this cannot be combined with --no-cache",
+    )
+    pipeline.add_argument("--reanalyze", action="store_true", help="Input is an edited segments file; redo only the affected sentiment and summary calls")
+    pipeline.add_argument("--overlap-llm", action="store_true", help="Send LLM requests while Whisper is still decoding")
+    pipeline.add_argument("--llm-workers", type=int, default=4, help="Concurrent LLM requests per recording (default: 4)")
+    pipeline.add_argument("--early-stop", action="store_true", help="Stream LLM responses and stop once the answer is complete")
+
+    analysis = parser.add_argument_group("analysis")
+    analysis.add_argument("--diarization-backend", choices=["llm", "acoustic"], default="llm")
+    analysis.add_argument("--context-overlap", type=int, default=0, help="Neighbouring segments sent as diarization context")
+    analysis.add_argument("--diarization-token-budget", type=int, default=None, help="Size diarization requests by estimated tokens")
+    analysis.add_argument("--summary-token-budget", type=int, default=None, help="Summarize long interviews in rounds within this many tokens")
+    analysis.add_argument("--sentiment-batch-token-budget", type=int, default=None, help="Pack several segments into each sentiment request, up to this many tokens")
+
+    batch = parser.add_argument_group("batch mode")
+    batch.add_argument("--extraction-workers", type=int, default=2)
+    batch.add_argument("--transcription-workers", type=int, default=1)
+    batch.add_argument("--batch-llm-workers", type=int, default=2, help="Recordings in the LLM stages at once (default: 2)")
+    batch.add_argument("--batch-summary", default="batch_summary.json", help="Where to write the batch results")
+
+    args = parser.parse_args(argv)
+    if args.no_wav and not args.in_memory_audio:
+        parser.error("--no-wav requires --in-memory-audio")
+    if args.state_file and args.no_cache:
+        parser.error("--state-file resumes from cached stage outputs and cannot be combined with --no-cache")
+    if not os.path.exists(args.input):
+        parser.error(f"input not found: {args.input}")
+    return args
+
+
+def is_batch_input(path: str) -> bool:
+    """Directories and manifests (anything that is not a media file) run in batch mode."""
+    return os.path.isdir(path) or not path.lower().endswith(MEDIA_EXTENSIONS)
+
+
+def orchestrator_options(args) -> dict:
+    options = {
+        "in_memory_audio": args.in_memory_audio,
+        "save_wav": not args.no_wav,
+        "use_cache": not args.no_cache,
+        "overlap_llm": args.overlap_llm,
+        "llm_workers": args.llm_workers,
+        "context_overlap": args.context_overlap,
+        "diarization_backend": args.diarization_backend,
+        "diarization_token_budget": args.diarization_token_budget,
+        "summary_token_budget": args.summary_token_budget,
+        "sentiment_batch_token_budget": args.sentiment_batch_token_budget,
+        "early_stop": args.early_stop,
+    }
+    if args.cache_dir:
+        options["cache_dir"] = args.cache_dir
+    return options
 
-if __name__ == "__main__":
-    state = StateManager()
-    orchestrator_agent = OrchestratorAgent(state)
 
-    # Use the actual video file in the data directory
-    video_path = os.path.join("data", "interview.mp4")
+def run_batch(inputs: str, args=None):
+    """Run the pipeline over a directory or manifest of recordings."""
+    from agents.batch_orchestrator_agent import BatchOrchestratorAgent
+
+    args = args or parse_args([inputs])
+    batch_agent = BatchOrchestratorAgent(
+        extraction_workers=args.extraction_workers,
+        transcription_workers=args.transcription_workers,
+        llm_workers=args.batch_llm_workers,
+        state_path=args.state_file,
+        **orchestrator_options(args),
+    )
+    results = batch_agent.run(inputs)
+    batch_agent.save_summary(results, args.batch_summary)
+    return all(r["status"] == "ok" for r in results)
+
+
+def run_single(video_path: str, args):
+    """Run the pipeline on one recording and print where its outputs were written."""
+    from core.state_mangement import StateManager
+    from agents.orchestrator_agent import OrchestratorAgent
+
+    # Runs are keyed by recording, so one state file can hold several
+    state = StateManager(args.state_file, run_id=os.path.abspath(video_path))
+    orchestrator_agent = OrchestratorAgent(state, **orchestrator_options(args))
 
     try:
         success = orchestrator_agent.run(video_path)
@@ -18,10 +118,45 @@ if __name__ == "__main__":
             print(f"📁 Audio: {state.get_state('audio_path')}")
             print(f"📝 Transcript: {state.get_state('transcript_file')}")
             print(f"📋 JSON Segments: {state.get_state('segments_json_file')}")
+            print(f"📋 JSONL Segments: {state.get_state('segments_jsonl_file')}")
+            print(f"📊 Summary Report: {state.get_state('summary_json_file')}")
+            print(f"📑 Analysis Report: {state.get_state('summary_text_file')}")
             print(f"🗣️  Language: {state.get_state('language')}")
             print(f"📊 Total Segments: {state.get_state('total_segments')}")
         else:
             print("❌ Pipeline failed")
+        return bool(success)
 
     except Exception as e:
         print(f"Error during pipeline execution: {e}")
+        return False
+
+
+def run_reanalysis(segments_path: str, args):
+    """Rebuild the reports for an edited segments file, reusing results for unchanged segments."""
+    from core.state_mangement import StateManager
+    from agents.orchestrator_agent import OrchestratorAgent
+
+    state = StateManager(args.state_file, run_id=os.path.abspath(segments_path))
+    orchestrator_agent = OrchestratorAgent(state, **orchestrator_options(args))
+    orchestrator_agent.reanalyze(segments_path)
+    print(f"📄 Sentiment Report: {state.get_state('sentiment_md_file')}")
+    print(f"📊 Summary Report: {state.get_state('summary_json_file')}")
+    print(f"📑 Analysis Report: {state.get_state('summary_text_file')}")
+    return True
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.no_llm_cache:
+        # query_ollama checks this on every request
+        os.environ["LLM_CACHE_DISABLED"] = "1"
+    if args.reanalyze:
+        return run_reanalysis(args.input, args)
+    if is_batch_input(args.input):
+        return run_batch(args.input, args)
+    return run_single(args.input, args)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,219 @@
+import wave
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_LENGTH = 400  # 25 ms at 16 kHz
+FRAME_HOP = 160  # 10 ms at 16 kHz
+N_FFT = 512
+N_MELS = 40
+N_MFCC = 13
+
+
+def load_wav(audio_path: str) -> np.ndarray:
+    """Read a 16 kHz mono 16-bit WAV (as written by AudioExtractionAgent) into float32 samples."""
+    with wave.open(audio_path, "rb") as f:
+        if f.getnchannels() != 1 or f.getsampwidth() != 2 or f.getframerate() != SAMPLE_RATE:
+            raise ValueError(f"Expected 16 kHz mono 16-bit PCM audio: {audio_path}")
+        pcm = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+    return pcm.astype(np.float32) / 32768.0
+
+
+def _mel_filterbank() -> np.ndarray:
+    """Triangular mel filters, shape (N_MELS, N_FFT // 2 + 1)."""
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10 ** (mel / 2595.0) - 1.0)
+
+    mel_points = np.linspace(hz_to_mel(0.0), hz_to_mel(SAMPLE_RATE / 2), N_MELS + 2)
+    bins = np.floor((N_FFT + 1) * mel_to_hz(mel_points) / SAMPLE_RATE).astype(int)
+
+    filters = np.zeros((N_MELS, N_FFT // 2 + 1), dtype=np.float32)
+    for m in range(1, N_MELS + 1):
+        left, center, right = bins[m - 1], bins[m], bins[m + 1]
+        if center > left:
+            filters[m - 1, left:center] = (np.arange(left, center) - left) / (center - left)
+        if right > center:
+            filters[m - 1, center:right] = (right - np.arange(center, right)) / (right - center)
+    return filters
+
+
+def _dct_matrix() -> np.ndarray:
+    """Orthonormal DCT-II basis, shape (N_MFCC, N_MELS)."""
+    n = np.arange(N_MELS)
+    k = np.arange(N_MFCC)[:, None]
+    basis = np.cos(np.pi / N_MELS * (n + 0.5) * k) * np.sqrt(2.0 / N_MELS)
+    basis[0] /= np.sqrt(2.0)
+    return basis.astype(np.float32)
+
+
+MEL_FILTERS = _mel_filterbank()
+DCT_BASIS = _dct_matrix()
+WINDOW = np.hamming(FRAME_LENGTH).astype(np.float32)
+
+
+def mfcc(samples: np.ndarray) -> np.ndarray:
+    """Compute MFCC frames for a 1-D signal, shape (n_frames, N_MFCC)."""
+    if len(samples) < FRAME_LENGTH:
+        samples = np.pad(samples, (0, FRAME_LENGTH - len(samples)))
+    n_frames = 1 + (len(samples) - FRAME_LENGTH) // FRAME_HOP
+    # Strided view of overlapping frames, no copy until the window is applied
+    frames = np.lib.stride_tricks.as_strided(
+        samples,
+        shape=(n_frames, FRAME_LENGTH),
+        strides=(samples.strides[0] * FRAME_HOP, samples.strides[0]),
+        writeable=False,
+    )
+    power = np.abs(np.fft.rfft(frames * WINDOW, n=N_FFT)) ** 2 / N_FFT
+    log_mel = np.log(power @ MEL_FILTERS.T + 1e-10)
+    return log_mel @ DCT_BASIS.T
+
+
+def segment_embeddings(audio: np.ndarray, segments: List[Dict]) -> np.ndarray:
+    """
+    One fixed-size embedding per segment: mean and standard deviation of its MFCCs
+    (without c0, which mostly tracks loudness), normalized across all segments.
+    """
+    audio = np.ascontiguousarray(audio, dtype=np.float32)
+    embeddings = np.zeros((len(segments), 2 * (N_MFCC - 1)), dtype=np.float32)
+    for i, seg in enumerate(segments):
+        start = int(seg["start"] * SAMPLE_RATE)
+        end = max(start + FRAME_LENGTH, int(seg["end"] * SAMPLE_RATE))
+        coefficients = mfcc(audio[start:end])[:, 1:]
+        embeddings[i, : N_MFCC - 1] = coefficients.mean(axis=0)
+        embeddings[i, N_MFCC - 1:] = coefficients.std(axis=0)
+
+    # Per-dimension normalization so no coefficient dominates the distances
+    std = embeddings.std(axis=0)
+    std[std == 0] = 1.0
+    return (embeddings - embeddings.mean(axis=0)) / std
+
+
+def kmeans(points: np.ndarray, k: int, iterations: int = 50, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """k-means with k-means++ seeding; returns (labels, centroids)."""
+    rng = np.random.default_rng(seed)
+    centroids = [points[rng.integers(len(points))]]
+    for _ in range(1, k):
+        distances = ((points[:, None, :] - np.array(centroids)[None]) ** 2).sum(-1).min(axis=1)
+        if distances.sum() == 0:
+            centroids.append(points[rng.integers(len(points))])
+        else:
+            centroids.append(points[rng.choice(len(points), p=distances / distances.sum())])
+    centroids = np.array(centroids)
+
+    labels = np.zeros(len(points), dtype=int)
+    for iteration in range(iterations):
+        distances = ((points[:, None, :] - centroids[None]) ** 2).sum(-1)
+        new_labels = distances.argmin(axis=1)
+        if iteration > 0 and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for c in range(k):
+            members = points[labels == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+    return labels, centroids
+
+
+def silhouette(points: np.ndarray, labels: np.ndarray, max_points: int = 2000, seed: int = 0) -> float:
+    """Mean silhouette coefficient, on a fixed random subsample for long recordings; used to pick the number of speakers."""
+    clusters = np.unique(labels)
+    if len(clusters) < 2:
+        return -1.0
+    if len(points) > max_points:
+        keep = np.random.default_rng(seed).choice(len(points), max_points, replace=False)
+        points, labels = points[keep], labels[keep]
+
+    squared = (points ** 2).sum(axis=1)
+    distances = np.sqrt(np.maximum(squared[:, None] + squared[None] - 2 * points @ points.T, 0.0))
+
+    # Mean distance from every point to every cluster, one column per cluster
+    members = labels[:, None] == clusters[None]
+    counts = members.sum(axis=0)
+    mean_to_cluster = distances @ members / np.maximum(counts, 1)
+
+    own = members.argmax(axis=1)
+    own_counts = counts[own]
+    # Exclude the point itself from its own cluster's mean
+    a = mean_to_cluster[np.arange(len(points)), own] * own_counts / np.maximum(own_counts - 1, 1)
+    mean_to_cluster[np.arange(len(points)), own] = np.inf
+    b = mean_to_cluster.min(axis=1)
+    scores = np.where(own_counts > 1, (b - a) / np.maximum(np.maximum(a, b), 1e-10), 0.0)
+    return float(scores.mean())
+
+
+def cluster_speakers(
+    audio: np.ndarray,
+    segments: List[Dict],
+    num_speakers: Optional[int] = 2,
+    max_speakers: int = 4,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cluster segments by voice.
+
+    Args:
+        audio: 16 kHz mono float32 samples
+        segments: Segments with start/end times in seconds
+        num_speakers: Fixed number of speakers, or None to choose 2..max_speakers by silhouette
+
+    Returns:
+        (cluster label per segment, confidence per segment). Confidence compares the
+        distances to the nearest and second-nearest centroids and lies in [0.5, 1].
+    """
+    if len(segments) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=np.float32)
+
+    points = segment_embeddings(audio, segments)
+    if num_speakers is not None:
+        candidates = [min(num_speakers, len(segments))]
+    else:
+        candidates = list(range(2, min(max_speakers, len(segments)) + 1)) or [1]
+
+    best = None
+    for k in candidates:
+        labels, centroids = kmeans(points, k)
+        score = silhouette(points, labels) if len(candidates) > 1 else 0.0
+        if best is None or score > best[0]:
+            best = (score, labels, centroids)
+    _, labels, centroids = best
+
+    if len(centroids) < 2:
+        return labels, np.ones(len(segments), dtype=np.float32)
+
+    distances = np.sqrt(((points[:, None, :] - centroids[None]) ** 2).sum(-1))
+    nearest = np.sort(distances, axis=1)[:, :2]
+    confidence = nearest[:, 1] / (nearest[:, 0] + nearest[:, 1] + 1e-10)
+    return labels, confidence.astype(np.float32)
+
+
+def cluster_samples(segments: List[Dict], labels: np.ndarray, max_chars: int = 600) -> Dict[int, List[str]]:
+    """Representative text per cluster, for mapping clusters to roles."""
+    samples: Dict[int, List[str]] = {}
+    lengths: Dict[int, int] = {}
+    for seg, label in zip(segments, labels.tolist()):
+        if lengths.get(label, 0) >= max_chars:
+            continue
+        samples.setdefault(label, []).append(seg["text"])
+        lengths[label] = lengths.get(label, 0) + len(seg["text"])
+    return samples
+
+
+def question_ratio(texts: List[str]) -> float:
+    """Share of texts that contain a question; interviewers ask more of them."""
+    if not texts:
+        return 0.0
+    return sum("?" in text for text in texts) / len(texts)
+
+
+def default_role_mapping(samples: Dict[int, Any]) -> Dict[int, str]:
+    """Heuristic fallback: the most inquisitive cluster is the interviewer."""
+    if not samples:
+        return {}
+    interviewer = max(samples, key=lambda label: question_ratio(samples[label]))
+    return {
+        label: "INTERVIEWER" if label == interviewer else "CANDIDATE"
+        for label in samples
+    }
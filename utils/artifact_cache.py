@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional
+
+DEFAULT_ARTIFACT_DIR = os.path.join(".cache", "artifacts")
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Hash a file's content in fixed-size chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_sha256(data: Any) -> str:
+    """Hash a JSON-serializable value independently of dict key order."""
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ArtifactCache:
+    """On-disk store of pipeline stage outputs keyed by input content and parameters.
+
+    Each stage key hashes the stage name, the key (or content hash) of its input
+    and its parameters, so a changed video or parameter invalidates that stage and
+    every stage after it.
+    """
+
+    def __init__(self, root: str = DEFAULT_ARTIFACT_DIR):
+        self.root = root
+
+    def key(self, stage: str, upstream: str, params: Optional[Dict[str, Any]] = None) -> str:
+        payload = json.dumps(
+            {"stage": stage, "upstream": upstream, "params": params or {}},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, stage: str, key: str) -> str:
+        return os.path.join(self.root, stage, f"{key}.json")
+
+    def load(self, stage: str, key: str) -> Optional[Dict[str, Any]]:
+        """Return the stored artifact, or None if missing or unreadable."""
+        path = self._path(stage, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def save(self, stage: str, key: str, artifact: Dict[str, Any]):
+        """Write an artifact atomically so a crash never leaves a half-written entry."""
+        path = self._path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(artifact, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def invalidate(self, stage: str, key: str):
+        path = self._path(stage, key)
+        if os.path.exists(path):
+            os.remove(path)
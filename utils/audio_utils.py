@@ -1,53 +1,47 @@
-import whisper
 import os
 import json
-from typing import Dict, Any, List
+import textwrap
+from typing import Dict, Any, Iterator, List, Optional
+from utils.whisper_models import get_whisper_model
 
+# Seconds of audio Whisper decodes per step, as in its own 30 s sliding window
+WINDOW_SECONDS = 30.0
 
-def transcribe_audio(audio_path: str, model_size: str = "base") -> Dict[str, Any]:
+
+def transcribe_audio(
+    audio_path: str,
+    model_size: str = "base",
+    device: Optional[str] = None,
+    dtype: Optional[str] = None,
+    audio: Optional[Any] = None,
+) -> Dict[str, Any]:
     """
     Transcribe audio file using OpenAI Whisper
 
+    Decodes with stream_transcribe_audio, so the segments are the same as when the
+    transcription is streamed.
+
     Args:
         audio_path (str): Path to the audio file
         model_size (str): Whisper model size ("tiny", "base", "small", "medium", "large")
+        device (str): Optional torch device; defaults to CUDA when available
+        dtype (str): Optional model dtype ("float32" or "float16")
+        audio: Optional 16 kHz mono float32 NumPy array already decoded in memory;
+            when given it is transcribed directly and audio_path is only used for naming
 
     Returns:
         Dict containing transcript text, segments in JSON format, and metadata
     """
     try:
-        # Check if audio file exists
-        if not os.path.exists(audio_path):
-            raise FileNotFoundError(f"Audio file not found: {audio_path}")
+        info = {}
+        segments = list(stream_transcribe_audio(
+            audio_path, model_size=model_size, device=device, dtype=dtype, audio=audio, info=info
+        ))
+        transcript_data = transcript_from_segments(segments, info)
 
-        print(f"Loading Whisper model ({model_size})...")
-        model = whisper.load_model(model_size)
-
-        print(f"Transcribing audio from {audio_path}...")
-        result = model.transcribe(audio_path)
-
-        # Convert segments to the requested JSON format
-        formatted_segments = []
-        for segment in result["segments"]:
-            formatted_segments.append(
-                {
-                    "start": round(segment["start"], 2),
-                    "end": round(segment["end"], 2),
-                    "text": segment["text"].strip(),
-                }
-            )
-
-        # Extract key information
-        transcript_data = {
-            "text": result["text"].strip(),
-            "language": result["language"],
-            "segments": formatted_segments,  # Now in the requested format
-            "audio_path": audio_path,
-        }
-
-        print(f"Transcription completed. Detected language: {result['language']}")
+        print(f"Transcription completed. Detected language: {transcript_data['language']}")
         print(f"Transcript length: {len(transcript_data['text'])} characters")
-        print(f"Number of segments: {len(formatted_segments)}")
+        print(f"Number of segments: {len(segments)}")
 
         return transcript_data
 
@@ -56,6 +50,103 @@ def transcribe_audio(audio_path: str, model_size: str = "base") -> Dict[str, Any
         raise e
 
 
+def transcript_from_segments(segments: List[Dict[str, Any]], info: Dict[str, Any]) -> Dict[str, Any]:
+    """Transcript data for segments from stream_transcribe_audio and the info dict it filled."""
+    return {
+        "text": " ".join(segment["text"] for segment in segments),
+        "language": info.get("language"),
+        "segments": segments,
+        "audio_path": info["audio_path"],
+    }
+
+
+def stream_transcribe_audio(
+    audio_path: str,
+    model_size: str = "base",
+    device: Optional[str] = None,
+    dtype: Optional[str] = None,
+    audio: Optional[Any] = None,
+    window_seconds: float = WINDOW_SECONDS,
+    info: Optional[Dict[str, Any]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Transcribe audio window by window, yielding segments as soon as each window is decoded
+
+    Each window is cut at the end of its last complete segment, so a segment that
+    straddles the window boundary is re-decoded at the start of the next window
+    and timestamps stay continuous across windows.
+
+    Args:
+        audio_path (str): Path to the audio file
+        model_size (str): Whisper model size ("tiny", "base", "small", "medium", "large")
+        device (str): Optional torch device; defaults to CUDA when available
+        dtype (str): Optional model dtype ("float32" or "float16")
+        audio: Optional 16 kHz mono float32 NumPy array already decoded in memory
+        window_seconds (float): Length of audio decoded per step
+        info (dict): Optional dict filled with "audio_path", "audio_duration" and, once known, "language"
+
+    Yields:
+        Segments in the {start, end, text} format used by transcribe_audio
+    """
+    from whisper.audio import SAMPLE_RATE, load_audio
+
+    if audio is None:
+        if not os.path.exists(audio_path):
+            raise FileNotFoundError(f"Audio file not found: {audio_path}")
+        audio = load_audio(audio_path)
+
+    model = get_whisper_model(model_size, device=device, dtype=dtype)
+    options = {"fp16": dtype == "float16"} if dtype else {}
+    if info is None:
+        info = {}
+    info["audio_path"] = audio_path
+    info["audio_duration"] = len(audio) / SAMPLE_RATE
+
+    print(f"Streaming transcription of {audio_path}...")
+    total_samples = len(audio)
+    window_samples = int(window_seconds * SAMPLE_RATE)
+    seek = 0
+    language = None
+    previous_text = None
+
+    while seek < total_samples:
+        window_end = min(seek + window_samples, total_samples)
+        offset = seek / SAMPLE_RATE
+        # Slicing a NumPy array is a view, so windows do not copy the audio
+        result = model.transcribe(
+            audio[seek:window_end],
+            language=language,
+            initial_prompt=previous_text,
+            **options,
+        )
+        if language is None:
+            # Pin the detected language so later windows skip detection
+            language = result["language"]
+            info["language"] = language
+
+        segments = result["segments"]
+        next_seek = window_end
+        if window_end < total_samples and len(segments) > 1:
+            # Drop the last, possibly truncated segment and resume from where the previous one ended
+            cut = seek + int(segments[-2]["end"] * SAMPLE_RATE)
+            if cut > seek:
+                segments = segments[:-1]
+                next_seek = cut
+
+        for segment in segments:
+            text = segment["text"].strip()
+            if not text:
+                continue
+            previous_text = text
+            yield {
+                "start": round(offset + segment["start"], 2),
+                "end": round(offset + segment["end"], 2),
+                "text": text,
+            }
+
+        seek = next_seek
+
+
 def save_transcript(transcript_data: Dict[str, Any], output_path: str = None) -> str:
     """
     Save transcript to a text file
@@ -86,13 +177,8 @@ def save_transcript(transcript_data: Dict[str, Any], output_path: str = None) ->
                 f.write("DETAILED SEGMENTS WITH SPEAKERS:\n")
                 f.write("=" * 50 + "\n\n")
 
-                for i, segment in enumerate(transcript_data["segments"]):
-                    start_time = format_timestamp(segment["start"])
-                    end_time = format_timestamp(segment["end"])
-                    speaker = segment.get("speaker", "UNKNOWN")
-                    confidence = segment.get("confidence", 0.0)
-                    
-                    f.write(f"[{start_time} - {end_time}] {speaker} (conf: {confidence:.2f}): {segment['text']}\n")
+                for segment in transcript_data["segments"]:
+                    f.write(_format_segment_line(segment))
 
         print(f"Transcript saved to: {output_path}")
         return output_path
@@ -120,11 +206,16 @@ def save_segments_json(transcript_data: Dict[str, Any], output_path: str = None)
             base_name = os.path.splitext(audio_path)[0]
             output_path = f"{base_name}_segments.json"
 
-        # Save segments in the requested format
-        segments = transcript_data["segments"]
-
+        # Written one segment at a time, so segments may also come from a generator;
+        # the layout is the same as json.dump(segments, f, indent=4)
         with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(segments, f, indent=4, ensure_ascii=False)
+            f.write("[")
+            count = 0
+            for i, segment in enumerate(transcript_data["segments"]):
+                f.write(",\n" if i else "\n")
+                f.write(textwrap.indent(json.dumps(segment, indent=4, ensure_ascii=False), "    "))
+                count = i + 1
+            f.write("\n]" if count else "]")
 
         print(f"Segments JSON saved to: {output_path}")
         return output_path
@@ -139,3 +230,12 @@ def format_timestamp(seconds: float) -> str:
     minutes = int(seconds // 60)
     seconds = int(seconds % 60)
     return f"{minutes:02d}:{seconds:02d}"
+
+
+def _format_segment_line(segment: Dict[str, Any]) -> str:
+    """Format one segment as a line of the detailed transcript section"""
+    start_time = format_timestamp(segment["start"])
+    end_time = format_timestamp(segment["end"])
+    speaker = segment.get("speaker", "UNKNOWN")
+    confidence = segment.get("confidence", 0.0)
+    return f"[{start_time} - {end_time}] {speaker} (conf: {confidence:.2f}): {segment['text']}\n"
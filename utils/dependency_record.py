@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+
+def segment_hash(segment: Dict[str, Any], fields: Sequence[str] = ("text",)) -> str:
+    """Content hash of the segment fields a result depends on (not of its position)."""
+    payload = json.dumps([segment.get(field) for field in fields], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def interview_base_name(path: str) -> str:
+    """Common path prefix of an interview's files: data/interview for data/interview.mp4 or data/interview_segments.json."""
+    base_name = os.path.splitext(path)[0]
+    if base_name.endswith("_segments"):
+        base_name = base_name[: -len("_segments")]
+        # A WAV recording's segments are named after its extracted copy, data/interview_audio.wav
+        if base_name.endswith("_audio") and os.path.exists(f"{base_name[: -len('_audio')]}.wav"):
+            base_name = base_name[: -len("_audio")]
+    return base_name
+
+
+def analysis_record_path(path: str) -> str:
+    """
+    Record file for an interview, next to its recording or segments file.
+
+    A full run and a later re-analysis of the edited segments file therefore
+    share one record.
+    """
+    return f"{interview_base_name(path)}_analysis_record.json"
+
+
+class DependencyRecord:
+    """
+    Derived results (LLM outputs) keyed by the content of the segments they were derived from.
+
+    Each entry stores the stage, the hashes of its input segments, the parameters
+    and the result. Looking up the same inputs again returns the stored result, so
+    after an edit only results whose segments changed are recomputed. Unlike the
+    prompt-level LLM cache, a result does not depend on where its segments sit in
+    the interview. save() drops entries of a stage that this run did not use,
+    while stages that did not run at all (e.g. restored from the artifact cache)
+    keep theirs.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._live = set()
+        self.reused: Dict[str, int] = {}
+        self.computed: Dict[str, int] = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f).get("entries", {})
+            except (OSError, json.JSONDecodeError):
+                self._entries = {}
+
+    def key(self, stage: str, inputs: List[str], params: Optional[Dict[str, Any]] = None) -> str:
+        payload = json.dumps({"stage": stage, "inputs": inputs, "params": params or {}}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def lookup(self, stage: str, inputs: List[str], params: Optional[Dict[str, Any]] = None) -> Any:
+        """Return the result recorded for these input segments, or None."""
+        key = self.key(stage, inputs, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._live.add(key)
+            self.reused[stage] = self.reused.get(stage, 0) + 1
+            return entry["result"]
+
+    def store(self, stage: str, inputs: List[str], result: Any, params: Optional[Dict[str, Any]] = None):
+        key = self.key(stage, inputs, params)
+        with self._lock:
+            self._entries[key] = {"stage": stage, "inputs": inputs, "params": params or {}, "result": result}
+            self._live.add(key)
+            self.computed[stage] = self.computed.get(stage, 0) + 1
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """Reused and recomputed result counts per stage for this run."""
+        with self._lock:
+            stages = sorted(set(self.reused) | set(self.computed))
+            return {stage: {"reused": self.reused.get(stage, 0), "computed": self.computed.get(stage, 0)} for stage in stages}
+
+    def save(self) -> Optional[str]:
+        """Write the record atomically, without the stale entries of the stages that ran."""
+        if not self.path:
+            return None
+        with self._lock:
+            active = set(self.reused) | set(self.computed)
+            entries = {
+                key: entry for key, entry in self._entries.items()
+                if key in self._live or entry["stage"] not in active
+            }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"entries": entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        return self.path
@@ -0,0 +1,68 @@
+import bisect
+import re
+from typing import Dict, List
+
+
+class KeywordIndex:
+    """
+    Precompiled keyword matcher for topic analysis.
+
+    Keywords match as whole words or phrases ("java" does not match "javascript").
+    All keywords are compiled into one alternation regex, so the texts are scanned
+    in a single pass however many keywords and topics there are. Where two keywords
+    start at the same word (e.g. "work" and "work with"), the longer one is counted.
+    """
+
+    def __init__(self, topics: Dict[str, List[str]]):
+        """
+        Args:
+            topics: Topic name -> keywords. Keywords may be shared between topics.
+        """
+        self.topics = {topic: [k.lower() for k in keywords] for topic, keywords in topics.items()}
+        # Each distinct keyword is matched once, however many topics use it
+        self.keyword_topics: Dict[str, List[str]] = {}
+        for topic, keywords in self.topics.items():
+            for keyword in keywords:
+                self.keyword_topics.setdefault(keyword, []).append(topic)
+        # Longest first, so the alternation prefers "work with" over "work"; the lookahead
+        # lets matches overlap, so a keyword inside a longer match is still found
+        alternation = "|".join(re.escape(k) for k in sorted(self.keyword_topics, key=len, reverse=True))
+        self.pattern = re.compile(rf"\b(?=({alternation})\b)")
+
+    def scan(self, texts: List[str]) -> Dict[str, Dict]:
+        """
+        Find topic keywords in lowercased texts.
+
+        Args:
+            texts: Lowercased segment texts
+
+        Returns:
+            Topic -> {"keywords": keywords found anywhere in " ".join(texts),
+                      "segments": sorted indexes of texts containing any of the topic's keywords}
+        """
+        joined = " ".join(texts)
+        # Offsets of each text in the joined string, plus one past the end
+        starts = []
+        offset = 0
+        for text in texts:
+            starts.append(offset)
+            offset += len(text) + 1
+        starts.append(offset)
+
+        found = {topic: set() for topic in self.topics}
+        segments = {topic: set() for topic in self.topics}
+        for match in self.pattern.finditer(joined):
+            keyword = match.group(1)
+            position = match.start()
+            index = bisect.bisect_right(starts, position) - 1
+            # A phrase spanning the space between two texts counts for the joined text only
+            in_segment = position + len(keyword) < starts[index + 1]
+            for topic in self.keyword_topics[keyword]:
+                found[topic].add(keyword)
+                if in_segment:
+                    segments[topic].add(index)
+
+        return {
+            topic: {"keywords": found[topic], "segments": sorted(segments[topic])}
+            for topic in self.topics
+        }
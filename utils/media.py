@@ -0,0 +1,4 @@
+# Kept free of heavy imports: main.py uses it before the arguments are parsed
+
+# Recordings the pipeline accepts; anything else given to main.py is treated as a batch manifest
+MEDIA_EXTENSIONS = (".mp4", ".mov", ".mkv", ".avi", ".webm", ".m4a", ".mp3", ".wav")
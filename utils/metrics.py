@@ -0,0 +1,222 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Linearly interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def distribution(values: List[float]) -> Dict[str, float]:
+    """count, sum, mean, max and p50/p95/p99 of a list of samples."""
+    ordered = sorted(values)
+    summary = {
+        "count": len(ordered),
+        "sum": sum(ordered),
+        "mean": sum(ordered) / len(ordered) if ordered else 0.0,
+        "max": ordered[-1] if ordered else 0.0,
+    }
+    for q in QUANTILES:
+        summary[f"p{int(q * 100)}"] = percentile(ordered, q)
+    return summary
+
+
+class Metrics:
+    """
+    Thread-safe collector for one pipeline run.
+
+    Records wall and CPU time per stage, per-call LLM latency, sizes and throughput,
+    and Whisper's real-time factor. summary() aggregates them (with p50/p95/p99);
+    save() writes JSON and Prometheus text files.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, List[Dict[str, float]]] = {}
+        self.llm_calls: List[Dict[str, Any]] = []
+        self.transcriptions: List[Dict[str, float]] = []
+        self.counters: Dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Time a block as one run of a stage.
+
+        CPU time is process-wide (it includes native threads such as Whisper's),
+        so stages that run concurrently share it.
+        """
+        wall_started = time.perf_counter()
+        cpu_started = time.process_time()
+        try:
+            yield
+        finally:
+            entry = {
+                "wall_seconds": time.perf_counter() - wall_started,
+                "cpu_seconds": time.process_time() - cpu_started,
+            }
+            with self._lock:
+                self.stages.setdefault(name, []).append(entry)
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_llm_call(
+        self,
+        model: str,
+        seconds: float,
+        prompt_chars: int,
+        response_chars: int,
+        prompt_tokens: int,
+        response_tokens: int,
+        generation_seconds: Optional[float] = None,
+    ):
+        """
+        Record one LLM request.
+
+        generation_seconds is the model's own decoding time when the server reports
+        it; otherwise tokens per second are computed from the request latency.
+        """
+        elapsed = generation_seconds or seconds
+        tokens_per_second = response_tokens / elapsed if elapsed > 0 else 0.0
+        with self._lock:
+            self.llm_calls.append({
+                "model": model,
+                "seconds": seconds,
+                "prompt_chars": prompt_chars,
+                "response_chars": response_chars,
+                "prompt_tokens": prompt_tokens,
+                "response_tokens": response_tokens,
+                "tokens_per_second": tokens_per_second,
+            })
+
+    def record_transcription(self, audio_seconds: float, seconds: float, model_size: str = None):
+        """Record one Whisper transcription; real-time factor is processing time / audio duration."""
+        with self._lock:
+            self.transcriptions.append({
+                "model_size": model_size,
+                "audio_seconds": audio_seconds,
+                "seconds": seconds,
+                "real_time_factor": seconds / audio_seconds if audio_seconds else 0.0,
+            })
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregated metrics as a JSON-serializable dict."""
+        with self._lock:
+            stages = {name: list(runs) for name, runs in self.stages.items()}
+            llm_calls = list(self.llm_calls)
+            transcriptions = list(self.transcriptions)
+            counters = dict(self.counters)
+
+        llm_by_model = {}
+        for call in llm_calls:
+            llm_by_model.setdefault(call["model"], []).append(call)
+        audio_seconds = sum(t["audio_seconds"] for t in transcriptions)
+        transcription_seconds = sum(t["seconds"] for t in transcriptions)
+
+        return {
+            "stages": {
+                name: {
+                    "runs": len(runs),
+                    "wall_seconds": sum(r["wall_seconds"] for r in runs),
+                    "cpu_seconds": sum(r["cpu_seconds"] for r in runs),
+                }
+                for name, runs in stages.items()
+            },
+            "llm": {
+                model: {
+                    "calls": len(calls),
+                    "latency_seconds": distribution([c["seconds"] for c in calls]),
+                    "tokens_per_second": distribution([c["tokens_per_second"] for c in calls]),
+                    "prompt_tokens": distribution([c["prompt_tokens"] for c in calls]),
+                    "response_tokens": distribution([c["response_tokens"] for c in calls]),
+                    "prompt_chars": sum(c["prompt_chars"] for c in calls),
+                    "response_chars": sum(c["response_chars"] for c in calls),
+                }
+                for model, calls in llm_by_model.items()
+            },
+            "whisper": {
+                "transcriptions": len(transcriptions),
+                "audio_seconds": audio_seconds,
+                "seconds": transcription_seconds,
+                "real_time_factor": transcription_seconds / audio_seconds if audio_seconds else 0.0,
+            },
+            "counters": counters,
+        }
+
+    def to_prometheus(self) -> str:
+        """Render the aggregates in the Prometheus text exposition format."""
+        summary = self.summary()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        stages = summary["stages"]
+        metric("pipeline_stage_wall_seconds", "gauge", "Wall-clock time spent in each pipeline stage.",
+               [({"stage": name}, s["wall_seconds"]) for name, s in stages.items()])
+        metric("pipeline_stage_cpu_seconds", "gauge", "Process CPU time spent while each pipeline stage ran.",
+               [({"stage": name}, s["cpu_seconds"]) for name, s in stages.items()])
+
+        llm = summary["llm"]
+        lines.append("# HELP llm_request_duration_seconds Latency of LLM requests.")
+        lines.append("# TYPE llm_request_duration_seconds summary")
+        for model, m in llm.items():
+            for q in QUANTILES:
+                value = m["latency_seconds"][f"p{int(q * 100)}"]
+                lines.append(f'llm_request_duration_seconds{{model="{model}",quantile="{q}"}} {value}')
+            lines.append(f'llm_request_duration_seconds_sum{{model="{model}"}} {m["latency_seconds"]["sum"]}')
+            lines.append(f'llm_request_duration_seconds_count{{model="{model}"}} {m["calls"]}')
+        metric("llm_tokens_per_second", "gauge", "Median generation throughput of LLM requests.",
+               [({"model": model}, m["tokens_per_second"]["p50"]) for model, m in llm.items()])
+        metric("llm_prompt_tokens_total", "counter", "Prompt tokens sent to the LLM.",
+               [({"model": model}, m["prompt_tokens"]["sum"]) for model, m in llm.items()])
+        metric("llm_response_tokens_total", "counter", "Tokens generated by the LLM.",
+               [({"model": model}, m["response_tokens"]["sum"]) for model, m in llm.items()])
+
+        whisper = summary["whisper"]
+        metric("whisper_audio_seconds", "gauge", "Duration of the transcribed audio.", [({}, whisper["audio_seconds"])])
+        metric("whisper_transcription_seconds", "gauge", "Time spent transcribing.", [({}, whisper["seconds"])])
+        metric("whisper_real_time_factor", "gauge", "Transcription time divided by audio duration.",
+               [({}, whisper["real_time_factor"])])
+
+        for name, value in sorted(summary["counters"].items()):
+            metric(f"{name}_total", "counter", f"Count of {name.replace('_', ' ')}.", [({}, value)])
+
+        return "\n".join(lines) + "\n"
+
+    def save(self, json_path: str, prometheus_path: str = None):
+        """Write the aggregates as JSON and, optionally, Prometheus text."""
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=4)
+        if prometheus_path:
+            with open(prometheus_path, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+        print(f"Metrics saved to: {json_path}")
+        return json_path
+
+
+def get_metrics(state=None) -> Optional[Metrics]:
+    """Return the Metrics stored in the state, registering a new collector if missing."""
+    if state is None:
+        return None
+
+    metrics = state.get_state("metrics")
+    if metrics is None:
+        metrics = Metrics()
+        state.set_state("metrics", metrics)
+    return metrics
@@ -1,20 +1,319 @@
-import subprocess
 import json
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence
 
-def query_ollama(prompt: str, model: str = "llama3.2") -> str:
-    """Query Ollama locally and return model response."""
-    try:
-        result = subprocess.run(
-            ["ollama", "run", model],
-            input=prompt.encode("utf-8"),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=120,
+from utils.llm_cache import cache_enabled, get_default_cache, make_cache_key
+from utils.token_utils import estimate_tokens
+
+DEFAULT_OLLAMA_HOST = "http://localhost:11434"
+
+# Counters Ollama reports with the final response (durations in nanoseconds)
+OLLAMA_STATS = ("prompt_eval_count", "eval_count", "eval_duration", "total_duration")
+
+SENTENCE_END = re.compile(r"[.!?]+(?:\s|$)")
+# query_ollama reports failures as a response starting with this prefix
+LLM_ERROR_PREFIX = "Error:"
+
+
+class StopOnLabel:
+    """Stop once one of labels has appeared, followed by `sentences` complete sentences.
+
+    Stop conditions are called with the text generated so far and must not keep
+    per-call state, since one instance is shared by concurrent requests.
+    """
+
+    def __init__(self, labels: Sequence[str], sentences: int = 0):
+        self.labels = [label.lower() for label in labels]
+        self.sentences = sentences
+        self.key = f"label:{','.join(self.labels)}:{sentences}"
+
+    def __call__(self, text: str) -> bool:
+        # A sentence can only have just ended if the text ends in punctuation or whitespace
+        if self.sentences and text[-1:] not in ".!?\n ":
+            return False
+        lowered = text.lower()
+        positions = [lowered.find(label) + len(label) for label in self.labels if label in lowered]
+        if not positions:
+            return False
+        if not self.sentences:
+            return True
+        # Complete sentences after the label; punctuation right after the label does not count
+        parts = SENTENCE_END.split(text[min(positions):])[:-1]
+        return sum(1 for part in parts if any(c.isalnum() for c in part)) >= self.sentences
+
+
+class StopOnJsonClosed:
+    """Stop once the first top-level JSON object or array in the text is closed."""
+
+    key = "json"
+
+    def __call__(self, text: str) -> bool:
+        if not text.rstrip().endswith(("}", "]")):
+            return False
+        depth = 0
+        in_string = False
+        escaped = False
+        for c in text:
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif c == "\\":
+                    escaped = True
+                elif c == '"':
+                    in_string = False
+            elif c == '"' and depth:
+                in_string = True
+            elif c in "{[":
+                depth += 1
+            elif c in "}]" and depth:
+                depth -= 1
+                if depth == 0:
+                    return True
+        return False
+
+
+class StopAfterTokens:
+    """Stop once roughly max_tokens tokens have been generated."""
+
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max_tokens
+        self.key = f"tokens:{max_tokens}"
+
+    def __call__(self, text: str) -> bool:
+        return estimate_tokens(text) >= self.max_tokens
+
+
+class AnyStop:
+    """Stop as soon as any of the given conditions is met."""
+
+    def __init__(self, *conditions):
+        self.conditions = conditions
+        self.key = "any(" + ",".join(c.key for c in conditions) + ")"
+
+    def __call__(self, text: str) -> bool:
+        return any(condition(text) for condition in self.conditions)
+
+
+class OllamaClient:
+    """Long-lived client for the local Ollama REST API.
+
+    Keeps a pooled keep-alive HTTP session so repeated prompts reuse the same
+    TCP connections instead of spawning an ``ollama run`` process per call.
+    """
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        timeout: float = 120,
+        pool_size: int = 8,
+        keep_alive: str = "5m",
+    ):
+        host = host or os.environ.get("OLLAMA_HOST", DEFAULT_OLLAMA_HOST)
+        if not host.startswith(("http://", "https://")):
+            host = f"http://{host}"
+        self.host = host.rstrip("/")
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+
+        # Imported on first client creation so that loading this module stays cheap
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def generate(
+        self,
+        prompt: str,
+        model: str = "llama3.2",
+        options: Optional[Dict[str, Any]] = None,
+        stop: Optional[Callable[[str], bool]] = None,
+        info: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Send a single generate request and return the text.
+
+        With a stop condition the response is streamed and the request is cancelled
+        as soon as stop(text so far) returns True; the text up to that point is returned.
+        If info is given it is filled with the token counts and timings Ollama reports
+        (OLLAMA_STATS); a cancelled request reports none.
+        """
+        if stop is not None:
+            text = ""
+            stream = self.stream_generate(prompt, model=model, options=options, info=info)
+            try:
+                for chunk in stream:
+                    text += chunk
+                    if stop(text):
+                        break
+            finally:
+                stream.close()
+            return text.strip()
+
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": self.keep_alive,
+        }
+        if options:
+            payload["options"] = options
+
+        response = self.session.post(
+            f"{self.host}/api/generate", json=payload, timeout=self.timeout
         )
+        response.raise_for_status()
+        data = response.json()
+        if info is not None:
+            info.update({key: data[key] for key in OLLAMA_STATS if key in data})
+        return data.get("response", "").strip()
+
+    def stream_generate(
+        self,
+        prompt: str,
+        model: str = "llama3.2",
+        options: Optional[Dict[str, Any]] = None,
+        info: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[str]:
+        """Send a streaming generate request and yield response chunks as they arrive.
+
+        Closing the generator early closes the HTTP connection, which makes Ollama
+        stop generating. info, if given, receives the final OLLAMA_STATS.
+        """
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+        }
+        if options:
+            payload["options"] = options
+
+        with self.session.post(
+            f"{self.host}/api/generate", json=payload, timeout=self.timeout, stream=True
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if "error" in data:
+                    raise RuntimeError(data["error"])
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    if info is not None:
+                        info.update({key: data[key] for key in OLLAMA_STATS if key in data})
+                    return
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client() -> OllamaClient:
+    """Return the process-wide shared Ollama client, creating it on first use."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = OllamaClient()
+        return _default_client
 
-        output = result.stdout.decode("utf-8").strip()
-        return output
-    except subprocess.TimeoutExpired:
-        return "Error: Ollama query timed out"
+
+def get_ollama_client(state=None) -> OllamaClient:
+    """Return the Ollama client stored in the state, registering the default one if missing."""
+    if state is None:
+        return get_default_client()
+
+    client = state.get_state("ollama_client")
+    if client is None:
+        client = get_default_client()
+        state.set_state("ollama_client", client)
+    return client
+
+
+def query_ollama(
+    prompt: str,
+    model: str = "llama3.2",
+    client: Optional[OllamaClient] = None,
+    options: Optional[Dict[str, Any]] = None,
+    use_cache: bool = True,
+    stop: Optional[Callable[[str], bool]] = None,
+    metrics=None,
+) -> str:
+    """Query Ollama locally and return model response.
+
+    Successful responses are cached on disk keyed by (model, prompt, options, stop);
+    pass use_cache=False or set LLM_CACHE_DISABLED=1 for non-deterministic runs.
+    With a stop condition (e.g. StopOnJsonClosed()) generation is cut short as soon
+    as the condition is met; only stop conditions with a `key` attribute (like the
+    ones in this module) are cacheable, other callables always query the model.
+    """
+    import requests
+
+    client = client or get_default_client()
+    stop_key = getattr(stop, "key", None)
+    # A response cut short by a stop condition without a key would be cached as the full answer
+    keyable = stop is None or stop_key is not None
+    cache = get_default_cache() if use_cache and keyable and cache_enabled() else None
+    key = make_cache_key(model, prompt, options, stop=stop_key) if cache else None
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            if metrics is not None:
+                metrics.increment("llm_cache_hits")
+            return cached
+
+    try:
+        if metrics is None:
+            response = client.generate(prompt, model=model, options=options, stop=stop)
+        else:
+            info = {}
+            started = time.perf_counter()
+            response = client.generate(prompt, model=model, options=options, stop=stop, info=info)
+            eval_duration = info.get("eval_duration")
+            metrics.record_llm_call(
+                model,
+                seconds=time.perf_counter() - started,
+                prompt_chars=len(prompt),
+                response_chars=len(response),
+                # Estimated from the text when Ollama did not report counts (e.g. cancelled streams)
+                prompt_tokens=info.get("prompt_eval_count", estimate_tokens(prompt)),
+                response_tokens=info.get("eval_count", estimate_tokens(response)),
+                generation_seconds=eval_duration / 1e9 if eval_duration else None,
+            )
+        if cache:
+            cache.put(key, response)
+        return response
+    except requests.Timeout:
+        if metrics is not None:
+            metrics.increment("llm_errors")
+        return f"{LLM_ERROR_PREFIX} Ollama query timed out"
     except Exception as e:
-        return f"Error: {e}"
+        if metrics is not None:
+            metrics.increment("llm_errors")
+        return f"{LLM_ERROR_PREFIX} {e}"
+
+
+def forget_response(
+    prompt: str,
+    model: str = "llama3.2",
+    options: Optional[Dict[str, Any]] = None,
+    stop: Optional[Callable[[str], bool]] = None,
+):
+    """Drop the cached response to a query_ollama request, so asking again reaches the model."""
+    if not cache_enabled():
+        return
+    get_default_cache().delete(make_cache_key(model, prompt, options, stop=getattr(stop, "key", None)))
+
+
+def is_llm_error(response: str) -> bool:
+    """Whether a query_ollama response is a failure report rather than model output."""
+    return response.startswith(LLM_ERROR_PREFIX)
@@ -0,0 +1,141 @@
+import json
+import os
+from array import array
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+# Readers scan for line offsets in blocks of this size
+OFFSET_SCAN_BLOCK = 1024 * 1024
+# Segments parsed per json.loads call when iterating
+READ_BATCH_LINES = 1024
+
+
+class SegmentWriter:
+    """
+    Append-only JSON Lines writer: one segment per line.
+
+    Memory stays flat however long the interview is. With flush_each, every line
+    is flushed as it is written so a reader can follow the file while it grows.
+    Use as a context manager.
+    """
+
+    def __init__(self, path: str, append: bool = False, flush_each: bool = True):
+        self.path = path
+        self.count = 0
+        self.flush_each = flush_each
+        self._file = open(path, "a" if append else "w", encoding="utf-8")
+
+    def append(self, segment: Dict[str, Any]):
+        self._file.write(json.dumps(segment, ensure_ascii=False) + "\n")
+        if self.flush_each:
+            self._file.flush()
+        self.count += 1
+
+    def extend(self, segments: Iterable[Dict[str, Any]]):
+        for segment in segments:
+            self.append(segment)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SegmentReader:
+    """
+    Lazy reader for a JSON Lines segment file.
+
+    Iterating parses the file a batch of lines at a time. Indexing (reader[i],
+    reader[a:b]) seeks straight to the line using an offset table built on first
+    use, which reads the file in blocks but parses nothing. Blank lines are skipped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._spans: Optional[Tuple[array, array]] = None
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        # Lines are parsed a batch at a time as one JSON array, which is about twice
+        # as fast as one json.loads call per line and still bounded in memory
+        with open(self.path, "r", encoding="utf-8") as f:
+            while True:
+                lines = list(islice(f, READ_BATCH_LINES))
+                if not lines:
+                    break
+                yield from json.loads("[" + ",".join(line for line in lines if line.strip()) + "]")
+
+    def __len__(self) -> int:
+        return len(self._line_spans()[0])
+
+    def __getitem__(self, index):
+        starts, ends = self._line_spans()
+        if isinstance(index, slice):
+            return [self._read(starts[i], ends[i]) for i in range(*index.indices(len(starts)))]
+        if index < 0:
+            index += len(starts)
+        if not 0 <= index < len(starts):
+            raise IndexError("segment index out of range")
+        return self._read(starts[index], ends[index])
+
+    def _read(self, start: int, end: int) -> Dict[str, Any]:
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            return json.loads(f.read(end - start))
+
+    def _line_spans(self):
+        """Start and end byte offsets of every non-empty line."""
+        if self._spans is None:
+            starts, ends = array("q"), array("q")
+            line_start = 0
+            position = 0
+            with open(self.path, "rb") as f:
+                for block in iter(lambda: f.read(OFFSET_SCAN_BLOCK), b""):
+                    newline = block.find(b"\n")
+                    while newline != -1:
+                        line_end = position + newline
+                        if line_end > line_start:
+                            starts.append(line_start)
+                            ends.append(line_end)
+                        line_start = line_end + 1
+                        newline = block.find(b"\n", newline + 1)
+                    position += len(block)
+            if position > line_start:
+                # Last line without a trailing newline
+                starts.append(line_start)
+                ends.append(position)
+            self._spans = (starts, ends)
+        return self._spans
+
+
+def segments_jsonl_path(audio_path: str) -> str:
+    """Default JSON Lines segment file next to the audio: data/interview_segments.jsonl for data/interview.wav."""
+    return f"{os.path.splitext(audio_path)[0]}_segments.jsonl"
+
+
+def stream_segments_jsonl(segments: Iterable[Dict[str, Any]], output_path: str, flush_each: bool = True) -> Iterator[Dict[str, Any]]:
+    """Append segments to a JSON Lines file as they are produced, passing them through unchanged."""
+    with SegmentWriter(output_path, flush_each=flush_each) as writer:
+        for segment in segments:
+            writer.append(segment)
+            yield segment
+
+    print(f"Segments JSONL saved to: {output_path}")
+
+
+def iter_segments(path: str) -> Iterator[Dict[str, Any]]:
+    """Iterate over the segments in a .jsonl or indented .json segment file."""
+    if path.endswith(".jsonl"):
+        return iter(SegmentReader(path))
+    with open(path, "r", encoding="utf-8") as f:
+        return iter(json.load(f))
+
+
+def count_segments(path: str) -> Optional[int]:
+    """Number of segments in a .jsonl file without parsing them; None for .json files."""
+    if path.endswith(".jsonl"):
+        return len(SegmentReader(path))
+    return None
@@ -0,0 +1,172 @@
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+SEGMENT_COLUMNS = ("start", "end", "text", "speaker", "confidence")
+
+
+class SegmentTable:
+    """
+    Columnar store for transcript segments.
+
+    start, end and confidence are float arrays and speaker is an int16 id into
+    `speakers` (-1 when a segment has no speaker). Texts are interned: each
+    distinct text is stored once in `texts` and segments refer to it by id.
+    Any other per-segment fields (reasoning, cluster, ...) are kept as object
+    columns in `extras`, so converting to dicts and back keeps every value. It
+    does not round-trip exactly: keys whose value is None are left out, and keys
+    come back in column order (start, end, text, speaker, confidence, extras).
+
+    Slicing with a slice returns a view that shares the arrays; indexing with a
+    boolean mask or an index array copies the (small) numeric columns but still
+    shares the text pool. from_dicts()/to_dicts() adapt to the list-of-dicts
+    format the agents and JSON files use.
+    """
+
+    def __init__(
+        self,
+        start: np.ndarray,
+        end: np.ndarray,
+        text_ids: np.ndarray,
+        texts: List[str],
+        speaker_ids: np.ndarray,
+        speakers: List[str],
+        confidence: np.ndarray,
+        extras: Optional[Dict[str, np.ndarray]] = None,
+    ):
+        self.start = start
+        self.end = end
+        self.text_ids = text_ids
+        self.texts = texts
+        self.speaker_ids = speaker_ids
+        self.speakers = speakers
+        self.confidence = confidence
+        self.extras = extras or {}
+
+    @classmethod
+    def from_dicts(cls, segments: Sequence[Dict[str, Any]]) -> "SegmentTable":
+        """Build a table from segment dicts ({start, end, text} plus optional speaker, confidence, ...)."""
+        count = len(segments)
+        start = np.empty(count, dtype=np.float64)
+        end = np.empty(count, dtype=np.float64)
+        confidence = np.full(count, np.nan, dtype=np.float64)
+        text_ids = np.empty(count, dtype=np.int32)
+        speaker_ids = np.full(count, -1, dtype=np.int16)
+        texts: List[str] = []
+        text_index: Dict[str, int] = {}
+        speakers: List[str] = []
+        speaker_index: Dict[str, int] = {}
+        extras: Dict[str, np.ndarray] = {}
+
+        for i, segment in enumerate(segments):
+            start[i] = segment["start"]
+            end[i] = segment["end"]
+            text = segment["text"]
+            text_id = text_index.get(text)
+            if text_id is None:
+                text_id = text_index[text] = len(texts)
+                texts.append(sys.intern(text))
+            text_ids[i] = text_id
+
+            speaker = segment.get("speaker")
+            if speaker is not None:
+                speaker_id = speaker_index.get(speaker)
+                if speaker_id is None:
+                    speaker_id = speaker_index[speaker] = len(speakers)
+                    speakers.append(speaker)
+                speaker_ids[i] = speaker_id
+            if segment.get("confidence") is not None:
+                confidence[i] = segment["confidence"]
+
+            for key, value in segment.items():
+                if key not in SEGMENT_COLUMNS:
+                    if key not in extras:
+                        extras[key] = np.full(count, None, dtype=object)
+                    extras[key][i] = value
+
+        return cls(start, end, text_ids, texts, speaker_ids, speakers, confidence, extras)
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def __getitem__(self, index):
+        """A segment dict for an integer index; a SegmentTable for a slice, mask or index array."""
+        if isinstance(index, (int, np.integer)):
+            return self.row(int(index))
+        return SegmentTable(
+            self.start[index],
+            self.end[index],
+            self.text_ids[index],
+            self.texts,
+            self.speaker_ids[index],
+            self.speakers,
+            self.confidence[index],
+            {key: column[index] for key, column in self.extras.items()},
+        )
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.to_dicts())
+
+    def row(self, i: int) -> Dict[str, Any]:
+        """Segment i in the dict format; keys whose value is None are left out."""
+        segment = {
+            "start": float(self.start[i]),
+            "end": float(self.end[i]),
+            "text": self.texts[self.text_ids[i]],
+        }
+        speaker_id = self.speaker_ids[i]
+        if speaker_id >= 0:
+            segment["speaker"] = self.speakers[speaker_id]
+        if not np.isnan(self.confidence[i]):
+            segment["confidence"] = float(self.confidence[i])
+        for key, column in self.extras.items():
+            if column[i] is not None:
+                segment[key] = column[i]
+        return segment
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [self.row(i) for i in range(len(self))]
+
+    def text_list(self) -> List[str]:
+        return [self.texts[text_id] for text_id in self.text_ids.tolist()]
+
+    def speaker_mask(self, speaker: str) -> np.ndarray:
+        """Boolean mask of the segments attributed to speaker."""
+        if speaker not in self.speakers:
+            return np.zeros(len(self), dtype=bool)
+        return self.speaker_ids == self.speakers.index(speaker)
+
+    def indexes(self, speaker: str) -> np.ndarray:
+        """Positions of the segments attributed to speaker."""
+        return np.flatnonzero(self.speaker_mask(speaker))
+
+    def durations(self) -> np.ndarray:
+        return self.end - self.start
+
+    def speaking_time(self, speaker: str = None) -> float:
+        """Total segment duration, for one speaker or for all segments."""
+        durations = self.durations()
+        if speaker is not None:
+            durations = durations[self.speaker_mask(speaker)]
+        return float(durations.sum())
+
+    def speaking_time_by_speaker(self) -> Dict[str, float]:
+        """Total duration per speaker in one reduction; segments without a speaker are left out."""
+        labelled = self.speaker_ids >= 0
+        totals = np.bincount(
+            self.speaker_ids[labelled], weights=self.durations()[labelled], minlength=len(self.speakers)
+        )
+        return {speaker: float(total) for speaker, total in zip(self.speakers, totals.tolist())}
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the numeric columns (texts and extras not included)."""
+        return sum(a.nbytes for a in (self.start, self.end, self.text_ids, self.speaker_ids, self.confidence))
+
+
+def segment_table(segments: Iterable[Dict[str, Any]]) -> SegmentTable:
+    """Return segments as a SegmentTable, converting a list of dicts if needed."""
+    if isinstance(segments, SegmentTable):
+        return segments
+    return SegmentTable.from_dicts(list(segments))
@@ -0,0 +1,125 @@
+import threading
+from concurrent.futures import Future
+from typing import Dict, Optional, Tuple
+
+ModelKey = Tuple[str, str, str]
+# Device part of the key when none is given; resolved to CUDA or CPU by the loader
+AUTO_DEVICE = "auto"
+
+
+class WhisperModelRegistry:
+    """Process-wide registry that loads each Whisper model once and reuses it.
+
+    Models are keyed by (model_size, device, dtype). Loads can be started in the
+    background with preload() and memory reclaimed with evict().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: Dict[ModelKey, Future] = {}
+        # Device each loaded model actually ended up on, for keys with the automatic device
+        self._devices: Dict[ModelKey, str] = {}
+
+    def _make_key(self, model_size: str, device: Optional[str], dtype: Optional[str]) -> ModelKey:
+        # The device is resolved by the loader, so preload() does not import torch on the caller's thread
+        return (model_size, device or AUTO_DEVICE, dtype or "float32")
+
+    def get(self, model_size: str = "base", device: Optional[str] = None, dtype: Optional[str] = None):
+        """Return the model for the key, loading it on first use (or waiting on a preload)."""
+        key = self._make_key(model_size, device, dtype)
+        return self._submit(key, background=False).result()
+
+    def preload(self, model_size: str = "base", device: Optional[str] = None, dtype: Optional[str] = None) -> Future:
+        """Start loading a model on a background thread and return its Future."""
+        key = self._make_key(model_size, device, dtype)
+        return self._submit(key, background=True)
+
+    def evict(self, model_size: Optional[str] = None, device: Optional[str] = None, dtype: Optional[str] = None) -> int:
+        """Drop cached models matching the given fields (all models if none given).
+
+        Returns the number of models evicted.
+        """
+        with self._lock:
+            keys = [
+                key
+                for key in self._models
+                if (model_size is None or key[0] == model_size)
+                and (device is None or self._devices.get(key, key[1]) == device)
+                and (dtype is None or key[2] == dtype)
+            ]
+            devices = [self._devices.pop(key, key[1]) for key in keys]
+            for key in keys:
+                del self._models[key]
+
+        if any(d.startswith("cuda") for d in devices):
+            import torch
+
+            torch.cuda.empty_cache()
+        return len(keys)
+
+    def loaded_models(self):
+        """Keys of models that have finished loading."""
+        with self._lock:
+            return [
+                key
+                for key, future in self._models.items()
+                if future.done() and future.exception() is None
+            ]
+
+    def _submit(self, key: ModelKey, background: bool) -> Future:
+        with self._lock:
+            future = self._models.get(key)
+            if future is not None:
+                return future
+            future = Future()
+            self._models[key] = future
+
+        if background:
+            threading.Thread(target=self._load, args=(key, future), daemon=True).start()
+        else:
+            self._load(key, future)
+        return future
+
+    def _load(self, key: ModelKey, future: Future):
+        model_size, device, dtype = key
+        try:
+            # Imported here: whisper pulls in torch, which takes seconds to import
+            import whisper
+
+            if device == AUTO_DEVICE:
+                import torch
+
+                device = "cuda" if torch.cuda.is_available() else "cpu"
+            with self._lock:
+                if self._models.get(key) is future:
+                    self._devices[key] = device
+            print(f"Loading Whisper model ({model_size}, {device}, {dtype})...")
+            model = whisper.load_model(model_size, device=device)
+            if dtype == "float16":
+                model = model.half()
+            future.set_result(model)
+        except Exception as e:
+            # Forget failed loads so the next call can retry
+            with self._lock:
+                if self._models.get(key) is future:
+                    del self._models[key]
+                    self._devices.pop(key, None)
+            future.set_exception(e)
+
+
+model_registry = WhisperModelRegistry()
+
+
+def get_whisper_model(model_size: str = "base", device: Optional[str] = None, dtype: Optional[str] = None):
+    """Return a cached Whisper model from the process-wide registry."""
+    return model_registry.get(model_size, device=device, dtype=dtype)
+
+
+def preload_whisper_model(model_size: str = "base", device: Optional[str] = None, dtype: Optional[str] = None) -> Future:
+    """Start loading a Whisper model in the background."""
+    return model_registry.preload(model_size, device=device, dtype=dtype)
+
+
+def evict_whisper_models(model_size: Optional[str] = None, device: Optional[str] = None, dtype: Optional[str] = None) -> int:
+    """Evict cached Whisper models to reclaim memory."""
+    return model_registry.evict(model_size, device=device, dtype=dtype)